@@ -1,4 +1,6 @@
 #!/bin/bash
+# Not run by config.py anymore: see autostart_apps there (modules/autostart.py).
+# Kept to start the session by hand.
 picom -f &
 nm-applet &
 blueman-applet &
@@ -0,0 +1,123 @@
+"""Event loop stalls of the dunst status: GenPollText versus DunstStatus.
+
+The benchmark first grows itself to ``--rss-mb`` of touched memory, like qtile
+after a day, then runs an asyncio loop for ``--seconds`` per path with a probe
+that wakes up every ``PROBE_MS``: how late it wakes up is how long the loop
+was stalled. Meanwhile the status is read every ``--interval`` seconds, the
+way each widget does it:
+
+- ``GenPollText``: the old widget, ``subprocess.check_output`` in the default
+  executor (``ThreadPoolText``);
+- ``DunstStatus poll``: ``DunstStatus``'s fallback without D-Bus, an asyncio
+  subprocess;
+- ``DunstStatus D-Bus``: ``DunstStatus`` with D-Bus, a signal handled on the
+  loop and no process at all.
+
+It prints p50/p99/max of the probe's lateness and the worst stall, which is
+what ``instrument``'s stall log records in qtile. Run from the config
+directory:
+
+    python bench/bench_dunst.py [--rss-mb 800] [--seconds 10] [--interval 0.1]
+
+``dunstctl is-paused`` is run when dunstctl is installed, ``echo false``
+otherwise.
+"""
+
+import argparse
+import asyncio
+import shutil
+import subprocess
+import time
+
+PAGE = 4096
+PROBE_MS = 5
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def grow(megabytes):
+    """Allocate and touch ``megabytes`` so that every page is mapped, as bench_spawn does."""
+    buf = bytearray(megabytes << 20)
+    for offset in range(0, len(buf), PAGE):
+        buf[offset] = 1
+    return buf
+
+
+def command():
+    if shutil.which("dunstctl"):
+        return ["dunstctl", "is-paused"]
+    return ["sh", "-c", "echo false"]
+
+
+def gen_poll_text(loop, cmd):
+    # ThreadPoolText.timer_setup runs poll() in the default executor
+    return loop.run_in_executor(None, lambda: subprocess.check_output(cmd).decode())
+
+
+async def dunst_poll(cmd):
+    # DunstStatus._run
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+    )
+    stdout, _ = await proc.communicate()
+    return stdout.decode().strip()
+
+
+async def dunst_signal(state):
+    # DunstStatus._properties_changed: the state arrives with the signal
+    state[0] = not state[0]
+
+
+async def run(read, seconds, interval):
+    loop = asyncio.get_running_loop()
+    lags = []
+    reads = []
+    end = time.perf_counter() + seconds
+
+    async def probe():
+        while time.perf_counter() < end:
+            expected = time.perf_counter() + PROBE_MS / 1000
+            await asyncio.sleep(PROBE_MS / 1000)
+            lags.append(max(time.perf_counter() - expected, 0) * 1000)
+
+    async def poll():
+        while time.perf_counter() < end:
+            reads.append(asyncio.ensure_future(read(loop)))
+            await asyncio.sleep(interval)
+
+    await asyncio.gather(probe(), poll())
+    await asyncio.gather(*reads)
+    return lags, len(reads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rss-mb", type=int, default=800)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--interval", type=float, default=0.1)
+    args = parser.parse_args()
+
+    cmd = command()
+    state = [False]
+    ballast = grow(args.rss_mb)
+    paths = dict(
+        [
+            ("GenPollText", lambda loop: gen_poll_text(loop, cmd)),
+            ("DunstStatus poll", lambda loop: dunst_poll(cmd)),
+            ("DunstStatus D-Bus", lambda loop: dunst_signal(state)),
+        ]
+    )
+    print(f"{len(ballast) >> 20} MB touched, {' '.join(cmd)} every {args.interval} s")
+    for name, read in paths.items():
+        lags, reads = asyncio.run(run(read, args.seconds, args.interval))
+        print(
+            f"{name:18} {reads:4} reads | loop lag p50 {percentile(lags, 50):6.2f} ms"
+            f" p99 {percentile(lags, 99):6.2f} ms worst stall {max(lags):6.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
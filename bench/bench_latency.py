@@ -0,0 +1,519 @@
+"""Headless latency benchmark of this config.
+
+Starts a virtual X server (Xvfb, or Xephyr with ``--server xephyr``) with
+three 1920x1080 screens, runs ``qtile start`` on config.py through a small X
+proxy that timestamps every request qtile sends, and replays the workloads
+below with XTEST for 10, 100 and 500 windows spread over groups 1 to 9:
+
+- ``open``: map the windows, latency from MapWindow to qtile's first
+  ConfigureWindow of that window;
+- ``next_layout``: ``mod+Tab`` through MonadTall, Max and Columns;
+- ``group_switch``: ``mod+1`` .. ``mod+9``, up to qtile's last
+  ConfigureWindow, MapWindow, UnmapWindow or UngrabServer, since a hidden
+  group laid out ahead of time may need no ConfigureWindow at all;
+- ``shuffle``: ``mod+shift+h/i/n/e``;
+- ``drag``: ``mod+Button1`` drag of a floating window;
+- ``drag_pacing`` / ``resize_pacing``: one second of ``mod+Button1`` /
+  ``mod+Button3`` drag with the pointer moving every 4 ms, like a 250 Hz
+  mouse. Latency goes from each motion to the next ConfigureWindow (the
+  window, or the resize outline); ``frame_p50_ms``/``frame_p99_ms`` are the
+  intervals between those ConfigureWindows, the frame pacing seen on screen,
+  and ``frames`` their number.
+
+Key and button latencies go from the XTEST event to the last ConfigureWindow
+qtile sends before it goes quiet. Each workload records p50/p99/max in
+milliseconds, the X requests qtile sent (total and ConfigureWindow) and the
+CPU time qtile used. Results are written as JSON; two runs are compared with
+``compare``. Run from the config directory:
+
+    python bench/bench_latency.py run [-o result.json] [--server xephyr] [--windows 10 100]
+    python bench/bench_latency.py compare before.json after.json
+
+Needs Xvfb or Xephyr, xcffib and qtile. Autostart is skipped through
+``QTILE_NO_AUTOSTART``.
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import math
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import xcffib
+import xcffib.xproto
+import xcffib.xtest
+from libqtile.command.client import InteractiveCommandClient
+from libqtile.command.interface import IPCCommandInterface
+from libqtile.ipc import Client
+
+CONFIG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG = os.path.join(CONFIG_DIR, "config.py")
+SOCKET_DIR = "/tmp/.X11-unix"
+
+SCREENS = ["1920x1080x24"] * 3
+GROUPS = "123456789"
+WINDOW_COUNTS = (10, 100, 500)
+
+MAP_WINDOW, UNMAP_WINDOW, CONFIGURE_WINDOW, UNGRAB_SERVER = 8, 10, 12, 37
+# the requests after which a group switch is on screen
+SWITCH_REQUESTS = {MAP_WINDOW, UNMAP_WINDOW, CONFIGURE_WINDOW, UNGRAB_SERVER}
+
+KEY_PRESS, KEY_RELEASE, BUTTON_PRESS, BUTTON_RELEASE, MOTION = 2, 3, 4, 5, 6
+KEYSYMS = {
+    "Super_L": 0xFFEB,
+    "Shift_L": 0xFFE1,
+    "Tab": 0xFF09,
+    **{c: ord(c) for c in "0123456789abcdefghijklmnopqrstuvwxyz"},
+}
+
+
+def free_display():
+    for number in range(90, 200):
+        if not os.path.exists(os.path.join(SOCKET_DIR, f"X{number}")) and not os.path.exists(
+            os.path.join(SOCKET_DIR, f"X{number + 1}")
+        ):
+            return number
+    raise RuntimeError("no free X display")
+
+
+def wait_for(predicate, timeout=10.0, interval=0.02, what="condition"):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return
+        time.sleep(interval)
+    raise TimeoutError(f"timed out waiting for {what}")
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    # nearest rank
+    values = sorted(values)
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+def start_server(kind, number):
+    if kind == "xephyr":
+        cmd = ["Xephyr", f":{number}", "-ac", "+xinerama", "-br", "-noreset"]
+        for geometry in SCREENS:
+            cmd += ["-screen", geometry.rsplit("x", 1)[0]]
+    else:
+        cmd = ["Xvfb", f":{number}", "-ac", "+xinerama", "-nolisten", "tcp", "-noreset"]
+        for index, geometry in enumerate(SCREENS):
+            cmd += ["-screen", str(index), geometry]
+    server = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    path = os.path.join(SOCKET_DIR, f"X{number}")
+    wait_for(lambda: os.path.exists(path), what=f"{cmd[0]} to start")
+    return server
+
+
+class RequestProxy:
+    """Forwards one X display to another and timestamps the requests clients send.
+
+    ``log`` holds ``(time, opcode, first argument)`` for every request; the
+    first argument is the window of ConfigureWindow, MapWindow...
+    """
+
+    def __init__(self, number, target):
+        self.path = os.path.join(SOCKET_DIR, f"X{number}")
+        self.target = os.path.join(SOCKET_DIR, f"X{target}")
+        self.log = []
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen(8)
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def close(self):
+        self.listener.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.listener.accept()
+            except OSError:
+                return
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.connect(self.target)
+            threading.Thread(target=self._pump, args=(server, client), daemon=True).start()
+            threading.Thread(target=self._requests, args=(client, server), daemon=True).start()
+
+    @staticmethod
+    def _pump(src, dst):
+        try:
+            while data := src.recv(65536):
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            dst.close()
+
+    def _requests(self, src, dst):
+        buf = b""
+
+        def need(n):
+            nonlocal buf
+            while len(buf) < n:
+                data = src.recv(65536)
+                if not data:
+                    raise EOFError
+                dst.sendall(data)
+                buf += data
+
+        try:
+            # connection setup: byte order, version, then auth name and data
+            need(12)
+            order = "<" if buf[0:1] == b"l" else ">"
+            name_len, data_len = struct.unpack(order + "HH", buf[6:10])
+            setup = 12 + name_len + (-name_len % 4) + data_len + (-data_len % 4)
+            need(setup)
+            buf = buf[setup:]
+            while True:
+                need(4)
+                opcode = buf[0]
+                length = struct.unpack(order + "H", buf[2:4])[0] * 4
+                if length == 0:
+                    # BIG-REQUESTS: the real length follows
+                    need(8)
+                    length = struct.unpack(order + "I", buf[4:8])[0] * 4
+                need(length)
+                arg = struct.unpack(order + "I", buf[4:8])[0] if length >= 8 else None
+                self.log.append((time.monotonic(), opcode, arg))
+                buf = buf[length:]
+        except (EOFError, OSError):
+            pass
+        finally:
+            dst.close()
+
+    def wait_quiet(self, since, quiet=0.05, timeout=2.0):
+        """Wait until no request came for ``quiet`` seconds, return the new requests."""
+        deadline = time.monotonic() + timeout
+        seen = len(self.log)
+        last_change = time.monotonic()
+        while time.monotonic() < deadline:
+            time.sleep(quiet / 5)
+            if len(self.log) != seen:
+                seen = len(self.log)
+                last_change = time.monotonic()
+            elif time.monotonic() - last_change >= quiet:
+                break
+        return self.log[since:seen]
+
+
+class Bench:
+    def __init__(self, display, proxy, qtile_pid, ipc):
+        self.proxy = proxy
+        self.qtile_pid = qtile_pid
+        self.ipc = ipc
+        self.conn = xcffib.connect(display=f":{display}")
+        self.xtest = self.conn(xcffib.xtest.key)
+        self.root = self.conn.get_setup().roots[0].root
+        self.keycodes = self._keycodes()
+        self.windows = []
+
+    def _keycodes(self):
+        setup = self.conn.get_setup()
+        count = setup.max_keycode - setup.min_keycode + 1
+        mapping = self.conn.core.GetKeyboardMapping(setup.min_keycode, count).reply()
+        per = mapping.keysyms_per_keycode
+        codes = {}
+        for index in range(count):
+            for keysym in mapping.keysyms[index * per : (index + 1) * per]:
+                codes.setdefault(keysym, setup.min_keycode + index)
+        return {name: codes[keysym] for name, keysym in KEYSYMS.items() if keysym in codes}
+
+    def cpu_time(self):
+        with open(f"/proc/{self.qtile_pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def fake(self, kind, detail=0, x=0, y=0):
+        self.xtest.FakeInput(kind, detail, 0, self.root, x, y, 0)
+
+    def press(self, *names):
+        """Press and release a key chord, return when the last key went down."""
+        codes = [self.keycodes[name] for name in names]
+        for code in codes[:-1]:
+            self.fake(KEY_PRESS, code)
+        self.conn.flush()
+        start = time.monotonic()
+        self.fake(KEY_PRESS, codes[-1])
+        self.conn.flush()
+        for code in reversed(codes):
+            self.fake(KEY_RELEASE, code)
+        self.conn.flush()
+        return start
+
+    def measure(self, action, opcodes=(CONFIGURE_WINDOW,)):
+        """Run ``action() -> start time``, return ms to qtile's last request in ``opcodes``."""
+        since = len(self.proxy.log)
+        start = action()
+        requests = self.proxy.wait_quiet(since)
+        configures = [t for t, opcode, _ in requests if opcode in opcodes]
+        if not configures:
+            return None
+        return (configures[-1] - start) * 1000
+
+    def open_windows(self, count):
+        latencies = []
+        per_group = [count // len(GROUPS) + (i < count % len(GROUPS)) for i in range(9)]
+        for group, n in zip(GROUPS, per_group):
+            self.ipc.group[group].toscreen()
+            mapped = {}
+            since = len(self.proxy.log)
+            for _ in range(n):
+                wid = self.conn.generate_id()
+                self.conn.core.CreateWindow(
+                    0, wid, self.root, 0, 0, 200, 150, 0,
+                    xcffib.xproto.WindowClass.InputOutput, 0, 0, [],
+                )
+                wm_class = b"bench\0Bench\0"
+                self.conn.core.ChangeProperty(
+                    xcffib.xproto.PropMode.Replace, wid, xcffib.xproto.Atom.WM_CLASS,
+                    xcffib.xproto.Atom.STRING, 8, len(wm_class), wm_class,
+                )
+                self.conn.core.MapWindow(wid)
+                self.conn.flush()
+                mapped[wid] = time.monotonic()
+                self.windows.append(wid)
+            expected = len(self.windows)
+            wait_for(lambda: len(self.ipc.windows()) >= expected, timeout=60, what="windows")
+            configured = {}
+            for t, opcode, arg in self.proxy.wait_quiet(since):
+                if opcode == CONFIGURE_WINDOW and arg in mapped:
+                    configured.setdefault(arg, t)
+            latencies += [(configured[w] - mapped[w]) * 1000 for w in mapped if w in configured]
+        return latencies
+
+    def cycle_layouts(self):
+        latencies = []
+        for group in GROUPS:
+            self.ipc.group[group].toscreen()
+            # MonadTall -> Max -> Columns -> MonadTall
+            for _ in range(3):
+                latencies.append(self.measure(lambda: self.press("Super_L", "Tab")))
+        return latencies
+
+    def close_windows(self):
+        for wid in self.windows:
+            self.conn.core.DestroyWindow(wid)
+        self.conn.flush()
+        self.windows = []
+        wait_for(lambda: not self.ipc.windows(), timeout=60, what="windows to close")
+
+    def drag(self, steps=30):
+        self.ipc.group["1"].toscreen()
+        self.ipc.window.toggle_floating()
+        info = self.ipc.window.info()
+        x, y = info["x"] + info["width"] // 2, info["y"] + info["height"] // 2
+        self.fake(MOTION, 0, x, y)
+        self.fake(KEY_PRESS, self.keycodes["Super_L"])
+        self.fake(BUTTON_PRESS, 1, x, y)
+        self.conn.flush()
+        latencies = []
+        for step in range(1, steps + 1):
+
+            def move(step=step):
+                self.fake(MOTION, 0, x + step * 10, y + step * 5)
+                self.conn.flush()
+                return time.monotonic()
+
+            latencies.append(self.measure(move))
+        self.fake(BUTTON_RELEASE, 1, x + steps * 10, y + steps * 5)
+        self.fake(KEY_RELEASE, self.keycodes["Super_L"])
+        self.conn.flush()
+        self.ipc.window.toggle_floating()
+        return latencies
+
+    def drag_pacing(self, button, seconds=1.0, interval=0.004):
+        self.ipc.group["1"].toscreen()
+        self.ipc.window.toggle_floating()
+        info = self.ipc.window.info()
+        x, y = info["x"] + info["width"] // 2, info["y"] + info["height"] // 2
+        self.fake(MOTION, 0, x, y)
+        self.fake(KEY_PRESS, self.keycodes["Super_L"])
+        self.fake(BUTTON_PRESS, button, x, y)
+        self.conn.flush()
+        since = len(self.proxy.log)
+        motions = []
+        for step in range(int(seconds / interval)):
+            self.fake(MOTION, 0, x + step % 200, y + step % 100)
+            self.conn.flush()
+            motions.append(time.monotonic())
+            time.sleep(interval)
+        self.fake(BUTTON_RELEASE, button, x + step % 200, y + step % 100)
+        self.fake(KEY_RELEASE, self.keycodes["Super_L"])
+        self.conn.flush()
+        requests = self.proxy.wait_quiet(since, quiet=0.2)
+        self.ipc.window.toggle_floating()
+
+        end = motions[-1]
+        frames = [t for t, opcode, _ in requests if opcode == CONFIGURE_WINDOW and t <= end]
+        intervals = [(b - a) * 1000 for a, b in zip(frames, frames[1:])]
+        self.extra = dict(
+            frames=len(frames),
+            frame_p50_ms=percentile(intervals, 50),
+            frame_p99_ms=percentile(intervals, 99),
+        )
+        latencies = []
+        for t in motions:
+            after = next((f for f in frames if f >= t), None)
+            if after is not None:
+                latencies.append((after - t) * 1000)
+        return latencies
+
+    def workload(self, name, run):
+        since = len(self.proxy.log)
+        cpu = self.cpu_time()
+        self.extra = {}
+        latencies = [ms for ms in run() if ms is not None]
+        cpu = self.cpu_time() - cpu
+        requests = self.proxy.log[since:]
+        return name, dict(
+            self.extra,
+            samples=len(latencies),
+            p50_ms=percentile(latencies, 50),
+            p99_ms=percentile(latencies, 99),
+            max_ms=max(latencies, default=None),
+            x_requests=len(requests),
+            configure_window=sum(1 for _, opcode, _ in requests if opcode == CONFIGURE_WINDOW),
+            cpu_s=round(cpu, 3),
+        )
+
+    def run(self, count):
+        def keys(chords, opcodes=(CONFIGURE_WINDOW,)):
+            return lambda: [
+                self.measure(lambda c=c: self.press(*c), opcodes) for c in chords
+            ]
+
+        results = dict(
+            [
+                self.workload("open", lambda: self.open_windows(count)),
+                self.workload("next_layout", self.cycle_layouts),
+                self.workload(
+                    "group_switch",
+                    keys([("Super_L", g) for g in GROUPS] * 3, SWITCH_REQUESTS),
+                ),
+                self.workload(
+                    "shuffle", keys([("Super_L", "Shift_L", k) for k in "hine"] * 5)
+                ),
+                self.workload("drag", self.drag),
+                self.workload("drag_pacing", lambda: self.drag_pacing(1)),
+                self.workload("resize_pacing", lambda: self.drag_pacing(3)),
+            ]
+        )
+        self.close_windows()
+        return results
+
+
+def metadata(server):
+    def output(*cmd):
+        try:
+            return subprocess.check_output(cmd, cwd=CONFIG_DIR, text=True).strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    with open(CONFIG, "rb") as f:
+        config_hash = hashlib.sha256(f.read()).hexdigest()
+    return dict(
+        date=datetime.datetime.now().isoformat(timespec="seconds"),
+        commit=output("git", "rev-parse", "HEAD"),
+        config_sha256=config_hash,
+        qtile=output("qtile", "--version"),
+        server=server,
+        screens=SCREENS,
+    )
+
+
+def run(args):
+    display = free_display()
+    proxied = display + 1
+    server = start_server(args.server, display)
+    proxy = RequestProxy(proxied, display)
+    tmp = tempfile.mkdtemp(prefix="qtile-bench-")
+    ipc_socket = os.path.join(tmp, "qtile.sock")
+    env = dict(os.environ, DISPLAY=f":{proxied}", QTILE_NO_AUTOSTART="1")
+    qtile = subprocess.Popen(
+        ["qtile", "start", "-b", "x11", "-c", CONFIG, "-s", ipc_socket],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for(lambda: os.path.exists(ipc_socket), timeout=30, what="qtile to start")
+        ipc = InteractiveCommandClient(IPCCommandInterface(Client(ipc_socket)))
+        wait_for(lambda: len(ipc.screens()) == len(SCREENS), what="screens")
+        bench = Bench(display, proxy, qtile.pid, ipc)
+        results = dict(meta=metadata(args.server), workloads={})
+        for count in args.windows:
+            print(f"{count} windows...", file=sys.stderr)
+            results["workloads"][str(count)] = bench.run(count)
+    finally:
+        qtile.terminate()
+        qtile.wait(timeout=10)
+        proxy.close()
+        server.terminate()
+        server.wait(timeout=10)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {args.output}", file=sys.stderr)
+
+
+def compare(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"before: {before['meta']['commit']}  after: {after['meta']['commit']}")
+    for count, workloads in after["workloads"].items():
+        for name, new in workloads.items():
+            old = before["workloads"].get(count, {}).get(name)
+            if old is None:
+                continue
+            cells = []
+            metrics = ("p50_ms", "p99_ms", "frame_p99_ms", "x_requests", "configure_window")
+            for metric in metrics + ("cpu_s",):
+                if metric not in new:
+                    continue
+                a, b = old.get(metric), new[metric]
+                if a is None or b is None:
+                    cells.append(f"{metric} n/a")
+                    continue
+                change = f"{(b - a) / a * 100:+.0f}%" if a else "n/a"
+                cells.append(f"{metric} {a:.4g} -> {b:.4g} ({change})")
+            print(f"{count:>4} {name:13} " + ", ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run")
+    run_parser.add_argument("-o", "--output", default="bench-latency.json")
+    run_parser.add_argument("--server", choices=("xvfb", "xephyr"), default="xvfb")
+    run_parser.add_argument("--windows", type=int, nargs="+", default=list(WINDOW_COUNTS))
+    run_parser.set_defaults(func=run)
+    compare_parser = sub.add_parser("compare")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.set_defaults(func=compare)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Micro-benchmark: linear Match scan versus modules.rules.compile_rules.
+
+Maps thousands of synthetic clients against the group and floating rules of
+config.py and prints the time per client for both. The floating rules are
+qtile's ``default_float_rules`` followed by the config's, as config.py builds
+them, so the ``has_fixed_size``/``has_fixed_ratio`` func rules are timed too. Run from the config
+directory:
+
+    python bench/bench_rules.py [clients]
+"""
+
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from libqtile import layout  # noqa: E402
+from libqtile.config import Match  # noqa: E402
+
+from modules.rules import compile_rules  # noqa: E402
+
+# the rules of config.py, written out so the config does not have to be loaded
+GROUP_RULES = [
+    Match(wm_class=re.compile(".*remmina|Remmina.*")),
+    Match(wm_class=re.compile(".*VirtualBox.*")),
+    Match(wm_class=re.compile(".*irt-manager,*")),
+    Match(wm_class="keepassxc"),
+    Match(wm_class=re.compile(".*teams.*")),
+]
+# as config.py builds them: qtile's defaults, func rules included, then ours
+FLOAT_RULES = [
+    *layout.Floating.default_float_rules,
+    Match(wm_class="confirmreset"),
+    Match(wm_class="makebranch"),
+    Match(wm_class="maketag"),
+    Match(wm_class="ssh-askpass"),
+    Match(title="branchdialog"),
+    Match(title="pinentry"),
+]
+
+CLASSES = [
+    ["remmina", "Org.remmina.Remmina"],
+    ["VirtualBox Machine", "VirtualBox Machine"],
+    ["virt-manager", "Virt-manager"],
+    ["keepassxc", "KeePassXC"],
+    ["teams", "Microsoft Teams - Preview"],
+    ["emacs", "Emacs"],
+    ["alacritty", "Alacritty"],
+    ["firefox", "firefox"],
+]
+TYPES = ["normal", "normal", "normal", "dialog", "utility"]
+# WM_NORMAL_HINTS: most windows are resizable, a few dialogs have a fixed size
+HINTS = [
+    dict(flags=set()),
+    dict(flags={"PMinSize"}, min_width=200, min_height=100),
+    dict(
+        flags={"PMinSize", "PMaxSize"},
+        min_width=400,
+        max_width=400,
+        min_height=300,
+        max_height=300,
+    ),
+]
+
+
+class FakeClient:
+    def __init__(self, wm_class, title, wm_type, hints):
+        self._wm_class = wm_class
+        self.name = title
+        self._wm_type = wm_type
+        self.hints = hints
+
+    def get_wm_class(self):
+        return self._wm_class
+
+    def get_wm_role(self):
+        return None
+
+    def get_wm_type(self):
+        return self._wm_type
+
+    # as libqtile.backend.x11.window._Window, for the default func rules
+    def has_fixed_size(self):
+        flags = self.hints["flags"]
+        return (
+            "PMinSize" in flags
+            and "PMaxSize" in flags
+            and 0 < self.hints["min_width"] == self.hints["max_width"]
+            and 0 < self.hints["min_height"] == self.hints["max_height"]
+        )
+
+    def has_fixed_ratio(self):
+        flags = self.hints["flags"]
+        return "PAspect" in flags and self.hints["min_aspect"] == self.hints["max_aspect"]
+
+    def match(self, match):
+        return match.compare(self)
+
+
+def run(matcher, clients):
+    start = time.perf_counter()
+    hits = sum(1 for c in clients if matcher(c))
+    return time.perf_counter() - start, hits
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rng = random.Random(42)
+    # titles repeat like transient dialogs do, so the memo gets some reuse
+    clients = [
+        FakeClient(
+            rng.choice(CLASSES),
+            f"window {rng.randrange(200)}",
+            rng.choice(TYPES),
+            rng.choices(HINTS, weights=(8, 3, 1))[0],
+        )
+        for _ in range(count)
+    ]
+    for label, rules in (("groups", GROUP_RULES), ("floating", FLOAT_RULES)):
+        compiled = compile_rules(rules)
+        linear, linear_hits = run(lambda c: any(m.compare(c) for m in rules), clients)
+        fast, fast_hits = run(compiled.compare, clients)
+        assert linear_hits == fast_hits, (label, linear_hits, fast_hits)
+        print(
+            f"{label:9} {count} clients: linear {linear / count * 1e6:7.2f} us/client, "
+            f"compiled {fast / count * 1e6:7.2f} us/client ({linear / fast:.1f}x) {compiled.info()}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Launch latency: qtile.spawn, asyncio subprocess, fork and the spawn helper.
+
+The benchmark first grows itself to ``--rss-mb`` of touched memory, like qtile
+after a day. It then launches ``sh -c 'echo > fifo'`` ``--runs`` times through
+each path and prints p50/p99/max of two numbers:
+
+- ``call``: the time spent in the launching process, i.e. how long qtile's
+  event loop is blocked. For the helper it is the time until its answer,
+  during which qtile's loop keeps running;
+- ``running``: the time until the child runs and writes to the fifo, i.e.
+  what the user waits for.
+
+Paths:
+
+- ``qtile.spawn``: what ``qtile.spawn`` does (PATH lookup, environment copy,
+  ``posix_spawnp``);
+- ``subprocess``: ``subprocess.Popen``, what ``asyncio.create_subprocess_exec``
+  runs;
+- ``fork``: ``os.fork`` then ``execvp``, the old way;
+- ``helper``: ``modules/spawner.py``'s helper, started before the growth.
+
+Run from the config directory (needs qtile for ``modules.spawner``)::
+
+    python bench/bench_spawn.py [--rss-mb 800] [--runs 200]
+"""
+
+import argparse
+import asyncio
+import os
+import select
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.spawner import SpawnHelper  # noqa: E402
+
+PAGE = 4096
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def grow(megabytes):
+    """Allocate and touch ``megabytes`` so that every page is mapped."""
+    buf = bytearray(megabytes << 20)
+    for offset in range(0, len(buf), PAGE):
+        buf[offset] = 1
+    return buf
+
+
+def qtile_spawn(args):
+    # the steps of libqtile.core.manager.Qtile.spawn
+    shutil.which(args[0])
+    env = os.environ.copy()
+    env.pop("VIRTUAL_ENV", None)
+    with open(os.devnull) as null:
+        file_actions = [(os.POSIX_SPAWN_DUP2, null.fileno(), fd) for fd in (0, 1, 2)]
+        return os.posix_spawnp(args[0], args, env, file_actions=file_actions)
+
+
+def popen(args):
+    return subprocess.Popen(
+        args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    ).pid
+
+
+def fork(args):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.execvp(args[0], args)
+        finally:
+            os._exit(127)
+    return pid
+
+
+def measure(launch, fifo, runs):
+    calls, running = [], []
+    for _ in range(runs):
+        reader = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+        args = ["sh", "-c", 'echo > "$1"', "sh", fifo]
+        start = time.perf_counter()
+        pid = launch(args)
+        returned = time.perf_counter()
+        if pid is None:
+            raise RuntimeError("launch failed")
+        select.select([reader], [], [], 5)
+        done = time.perf_counter()
+        os.close(reader)
+        calls.append((returned - start) * 1000)
+        running.append((done - start) * 1000)
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            # the helper's children are not ours
+            pass
+    return calls, running
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rss-mb", type=int, default=800)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    helper = SpawnHelper()
+    helper.start()
+    env = dict(os.environ)
+    ballast = grow(args.rss_mb)
+
+    tmp = tempfile.mkdtemp(prefix="bench-spawn-")
+    fifo = os.path.join(tmp, "fifo")
+    os.mkfifo(fifo)
+    paths = dict(
+        [
+            ("qtile.spawn", qtile_spawn),
+            ("subprocess", popen),
+            ("fork", fork),
+            ("helper", lambda a: loop.run_until_complete(helper.request(a, env))),
+        ]
+    )
+    print(f"{len(ballast) >> 20} MB touched, {args.runs} launches per path")
+    try:
+        for name, launch in paths.items():
+            calls, running = measure(launch, fifo, args.runs)
+            print(
+                f"{name:12} call p50 {percentile(calls, 50):6.2f} ms"
+                f" p99 {percentile(calls, 99):6.2f} ms max {max(calls):6.2f} ms |"
+                f" running p50 {percentile(running, 50):6.2f} ms"
+                f" p99 {percentile(running, 99):6.2f} ms max {max(running):6.2f} ms"
+            )
+    finally:
+        helper.stop()
+        loop.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
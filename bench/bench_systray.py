@@ -0,0 +1,205 @@
+"""Systray stress test: applets docking at once, changing icons and restarting.
+
+Starts a virtual X server and ``qtile start`` on config.py like
+``bench_latency.py``, then plays the tray applets with fake icons (plain
+windows speaking the system tray protocol):
+
+- ``dock``: ``--icons`` icons dock at once, like the autostart at login;
+- ``update``: every icon sets ``_XEMBED_INFO`` again ``--updates`` times,
+  like Qt applets do when they change their icon;
+- ``restart``: half of the icons go away and dock again, like Teams
+  restarting;
+- ``late``: ``--late`` icons dock unmapped (``_XEMBED_INFO`` flags 0), then
+  set the mapped flag, like applets that dock before their icon is ready.
+  With ``BatchedSystray`` this is the per-slot repaint path: the phase
+  reports ``slot_repaints`` and says so when it was not taken.
+
+After each phase it prints what the main bar did (``redraw_stats`` of the
+CoalescingBar: full redraws, widget repaints, frames) and the systray's own
+counters when it has them (``BatchedSystray``). Running it on an older commit
+gives the numbers of ``widget.Systray``. Run from the config directory:
+
+    python bench/bench_systray.py [--server xephyr] [--icons 8] [--updates 20] [--late 2]
+
+Needs Xvfb or Xephyr, xcffib and qtile.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import xcffib
+import xcffib.xproto
+from libqtile.command.client import InteractiveCommandClient
+from libqtile.command.interface import IPCCommandInterface
+from libqtile.ipc import Client
+
+from bench_latency import CONFIG, free_display, start_server, wait_for
+
+REQUEST_DOCK = 0
+BAR_COUNTERS = ("full_redraws", "performed", "frames")
+
+
+class FakeTray:
+    """Icons docking in the tray of screen 0, as an applet would."""
+
+    def __init__(self, display):
+        self.conn = xcffib.connect(display=f":{display}")
+        self.root = self.conn.get_setup().roots[0].root
+        self.atoms = {
+            name: self.conn.core.InternAtom(False, len(name), name).reply().atom
+            for name in ("_NET_SYSTEM_TRAY_S0", "_NET_SYSTEM_TRAY_OPCODE", "_XEMBED_INFO")
+        }
+        self.icons = []
+        self.created = 0
+
+    def owner(self):
+        return self.conn.core.GetSelectionOwner(self.atoms["_NET_SYSTEM_TRAY_S0"]).reply().owner
+
+    def set_embed_info(self, wid, mapped=True):
+        self.conn.core.ChangeProperty(
+            xcffib.xproto.PropMode.Replace, wid, self.atoms["_XEMBED_INFO"],
+            self.atoms["_XEMBED_INFO"], 32, 2, [0, int(mapped)],
+        )
+
+    def dock(self, count, mapped=True):
+        owner = self.owner()
+        for _ in range(count):
+            wid = self.conn.generate_id()
+            self.conn.core.CreateWindow(
+                0, wid, self.root, 0, 0, 20, 20, 0,
+                xcffib.xproto.WindowClass.InputOutput, 0,
+                xcffib.xproto.CW.BackPixel, [0x3080C0 + self.created * 0x101],
+            )
+            name = f"fake-icon-{self.created:02}".encode()
+            self.conn.core.ChangeProperty(
+                xcffib.xproto.PropMode.Replace, wid, xcffib.xproto.Atom.WM_NAME,
+                xcffib.xproto.Atom.STRING, 8, len(name), name,
+            )
+            self.set_embed_info(wid, mapped)
+            data = xcffib.xproto.ClientMessageData.synthetic(
+                [xcffib.xproto.Time.CurrentTime, REQUEST_DOCK, wid, 0, 0], "I" * 5
+            )
+            event = xcffib.xproto.ClientMessageEvent.synthetic(
+                format=32, window=owner, type=self.atoms["_NET_SYSTEM_TRAY_OPCODE"], data=data
+            )
+            self.conn.core.SendEvent(False, owner, xcffib.xproto.EventMask.NoEvent, event.pack())
+            self.icons.append(wid)
+            self.created += 1
+        self.conn.flush()
+
+    def update(self, rounds, interval):
+        for _ in range(rounds):
+            for wid in self.icons:
+                self.set_embed_info(wid)
+            self.conn.flush()
+            time.sleep(interval)
+
+    def map(self, wids):
+        for wid in wids:
+            self.set_embed_info(wid)
+        self.conn.flush()
+
+    def remove(self, count):
+        for wid in self.icons[:count]:
+            self.conn.core.DestroyWindow(wid)
+        self.icons = self.icons[count:]
+        self.conn.flush()
+
+
+def counters(ipc):
+    stats = ipc.screen[0].bar["top"].redraw_stats()
+    result = {name: stats[name] for name in BAR_COUNTERS}
+    tray = ipc.widget["systray"].info().get("tray", {})
+    result.update((f"tray.{name}", value) for name, value in tray.items())
+    return result
+
+
+def settle(ipc, quiet=0.5, timeout=15.0):
+    """Wait until the bar has not painted anything for ``quiet`` seconds."""
+    last, since = None, time.monotonic()
+    deadline = since + timeout
+    while time.monotonic() < deadline:
+        current = counters(ipc)
+        if current != last:
+            last, since = current, time.monotonic()
+        elif time.monotonic() - since >= quiet:
+            return current
+        time.sleep(0.05)
+    return last
+
+
+def report(phase, before, after):
+    cells = [
+        f"{name} {after[name] - before.get(name, 0):+d}"
+        for name in after
+        if isinstance(after[name], int) and not name.endswith("length")
+    ]
+    print(f"{phase:8} " + ", ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", choices=("xvfb", "xephyr"), default="xvfb")
+    parser.add_argument("--icons", type=int, default=8)
+    parser.add_argument("--updates", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.05)
+    parser.add_argument("--late", type=int, default=2)
+    args = parser.parse_args()
+
+    display = free_display()
+    server = start_server(args.server, display)
+    tmp = tempfile.mkdtemp(prefix="qtile-bench-")
+    ipc_socket = os.path.join(tmp, "qtile.sock")
+    env = dict(os.environ, DISPLAY=f":{display}", QTILE_NO_AUTOSTART="1")
+    qtile = subprocess.Popen(
+        ["qtile", "start", "-b", "x11", "-c", CONFIG, "-s", ipc_socket],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for(lambda: os.path.exists(ipc_socket), timeout=30, what="qtile to start")
+        ipc = InteractiveCommandClient(IPCCommandInterface(Client(ipc_socket)))
+        tray = FakeTray(display)
+        wait_for(lambda: tray.owner() != 0, what="the systray selection")
+        start = settle(ipc)
+
+        tray.dock(args.icons)
+        docked = settle(ipc)
+        report("dock", start, docked)
+
+        tray.update(args.updates, args.interval)
+        updated = settle(ipc)
+        report("update", docked, updated)
+
+        half = args.icons // 2
+        tray.remove(half)
+        tray.dock(half)
+        restarted = settle(ipc)
+        report("restart", updated, restarted)
+
+        tray.dock(args.late, mapped=False)
+        pending = settle(ipc)
+        tray.map(tray.icons[len(tray.icons) - args.late :])
+        late = settle(ipc)
+        report("late", pending, late)
+        if "tray.slot_repaints" in late:
+            slots = late["tray.slot_repaints"] - pending["tray.slot_repaints"]
+            taken = "taken" if slots else "NOT taken"
+            print(f"{'':8} per-slot repaint path {taken} ({slots} of {args.late} icons)")
+    finally:
+        qtile.terminate()
+        qtile.wait(timeout=10)
+        server.terminate()
+        server.wait(timeout=10)
+        shutil.rmtree(tmp, ignore_errors=True)
+    print(f"{args.icons} icons, {args.updates} updates each", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""Stress test: title changes on 50 windows, widget.TaskList versus CoalescingTaskList.
+
+Both widgets are configured like the ones in config.py on a bar drawing into
+an in-memory cairo surface. Every window changes its title ``rate`` times per
+second (a counter, like Teams during a call or Nextcloud syncing) for
+``seconds`` of simulated time, timers run on a simulated clock, and the CPU
+time spent by each widget is printed. Run from the config directory:
+
+    python bench/bench_tasklist.py [seconds] [rate]
+"""
+
+import heapq
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cairocffi  # noqa: E402
+from libqtile.backend.base.drawer import Drawer  # noqa: E402
+from libqtile.widget import TaskList  # noqa: E402
+
+from modules.tasklist import CoalescingTaskList  # noqa: E402
+
+WINDOWS = 50
+CONFIG = dict(
+    highlight_method="border",
+    icon_size=20,
+    max_title_width=150,
+    padding_x=0,
+    padding_y=0,
+    margin_y=0,
+    fontsize=17,
+    # the colours of config.py's main bar: translucent black over a transparent bar
+    border="ff9900",
+    foreground="ff9900",
+    margin=2,
+    borderwidth=1,
+    background="00000080",
+)
+BAR_BACKGROUND = "00000000"
+TITLES = [
+    "Microsoft Teams - Call in progress {}",
+    "Nextcloud - syncing {} files",
+    "emacs@host - *compilation* {}",
+    "Firefox - Inbox ({}) - Mail",
+]
+
+
+class Handle:
+    def __init__(self, entry):
+        self.entry = entry
+
+    def cancel(self):
+        self.entry[2] = None
+
+
+class Clock:
+    """call_later/call_soon on simulated time."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.queue = []
+        self.counter = itertools.count()
+
+    def call_later(self, delay, func, *args):
+        entry = [self.now + delay, next(self.counter), func, args]
+        heapq.heappush(self.queue, entry)
+        return Handle(entry)
+
+    def call_soon(self, func, *args):
+        return self.call_later(0, func, *args)
+
+    def run_until(self, end):
+        while self.queue and self.queue[0][0] <= end:
+            self.now, _, func, args = heapq.heappop(self.queue)
+            if func is not None:
+                func(*args)
+        self.now = end
+
+
+class FakeQtile:
+    class core:
+        name = "bench"
+
+    def __init__(self, clock):
+        self.call_later = clock.call_later
+        self.call_soon = clock.call_soon
+
+
+class ImageDrawer(Drawer):
+    def _draw(self, offsetx=0, offsety=0, width=None, height=None, src_x=0, src_y=0):
+        ctx = cairocffi.Context(self._win.target)
+        ctx.set_source_surface(self.surface, offsetx - src_x, offsety - src_y)
+        ctx.rectangle(offsetx, offsety, width or self.width, height or self.height)
+        ctx.fill()
+
+
+class FakeWindow:
+    def __init__(self, qtile, width, height):
+        self.qtile = qtile
+        self.target = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, width, height)
+
+    def create_drawer(self, width, height):
+        return ImageDrawer(self.qtile, self, width, height)
+
+
+class FakeBar:
+    """Queues one redraw per loop iteration, like bar.Bar.draw."""
+
+    horizontal = True
+    background = BAR_BACKGROUND
+
+    def __init__(self, qtile, clock, group, width=1900, height=24):
+        self.width, self.height = width, height
+        self.window = FakeWindow(qtile, width, height)
+        self.screen = type("Screen", (), dict(group=group, left=None, right=None))()
+        self.clock = clock
+        self.widgets = []
+        self.queued = False
+        self.redraws = 0
+
+    def draw(self):
+        if not self.queued:
+            self.queued = True
+            self.clock.call_soon(self._actual_draw)
+
+    def _actual_draw(self):
+        self.queued = False
+        self.redraws += 1
+        for widget in self.widgets:
+            widget.draw()
+
+
+class FakeGroup:
+    def __init__(self):
+        self.windows = []
+        self.current_window = None
+
+
+class FakeClient:
+    def __init__(self, wid, group, title):
+        self.wid = wid
+        self.group = group
+        self.name = title
+        self.icons = {}
+        self.urgent = self.minimized = self.maximized = self.floating = False
+
+
+def run(cls, seconds, rate):
+    clock = Clock()
+    qtile = FakeQtile(clock)
+    group = FakeGroup()
+    bar = FakeBar(qtile, clock, group)
+    rng = random.Random(42)
+    group.windows = [
+        FakeClient(wid, group, TITLES[wid % len(TITLES)].format(0)) for wid in range(WINDOWS)
+    ]
+    group.current_window = group.windows[0]
+
+    widget = cls(**CONFIG)
+    # no hooks and no timer_setup/_config_async: there is no event loop here
+    widget.setup_hooks = lambda: None
+    widget.configured = True
+    bar.widgets.append(widget)
+    widget._configure(qtile, bar)
+    widget.offsetx, widget.offsety, widget.length = 0, 0, bar.width
+    on_title = getattr(widget, "_title_changed", widget.update)
+    bar._actual_draw()
+
+    # every window changes its title `rate` times per second, at random phases
+    for window in group.windows:
+        for tick in range(int(seconds * rate)):
+            at = (tick + rng.random()) / rate
+            clock.queue.append([at, next(clock.counter), retitle, (window, tick, on_title)])
+    heapq.heapify(clock.queue)
+
+    start = time.process_time()
+    clock.run_until(seconds + 1)
+    cpu = time.process_time() - start
+    info = getattr(widget, "stats", {})
+    widget.finalize()
+    return cpu, bar.redraws, info
+
+
+def retitle(window, tick, on_title):
+    window.name = TITLES[window.wid % len(TITLES)].format(tick)
+    on_title(window)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    events = int(seconds * rate) * WINDOWS
+    results = {}
+    for label, cls in (("TaskList", TaskList), ("CoalescingTaskList", CoalescingTaskList)):
+        cpu, redraws, stats = run(cls, seconds, rate)
+        results[label] = cpu
+        print(
+            f"{label:19} {events} title changes over {seconds:.0f}s: "
+            f"cpu {cpu:6.3f}s ({cpu / seconds * 100:5.1f}% of one core), "
+            f"{redraws} bar redraws {stats or ''}"
+        )
+    ratio = results["TaskList"] / max(results["CoalescingTaskList"], 1e-9)
+    print(f"CoalescingTaskList uses {ratio:.1f}x less CPU")
+
+
+if __name__ == "__main__":
+    main()
@@ -24,18 +24,31 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from libqtile import bar, layout, qtile, widget, hook
+from modules import profiling
+from modules import instrument  # noqa: F401 (opt-in timings, see the module)
+from modules import memory  # noqa: F401 (opt-in tracemalloc, see the module)
+
+from libqtile import layout, qtile, widget, hook
 from libqtile.config import Click, Drag, Group, Key, Match, Screen
 from libqtile.lazy import lazy
-from libqtile.utils import guess_terminal
 
 import os
-import subprocess
 import re
-import pytz
+
+from modules import autostart, clock, completion, dispatch, drag, dunst, groupswitch
+from modules import imagecache, incremental, redraw, rules, sampler, spawner, tasklist, tiling
+from modules import systray, wallpaper
+from modules import mousefocus  # noqa: F401 (subscribes its hooks on import)
+from modules.terminal import cached_guess_terminal
+
+profiling.mark("imports")
+
+# launches go through a small helper process while it runs, see modules/spawner.py
+spawner.start()
 
 mod = "mod4"
-terminal = guess_terminal()
+# guess_terminal() probes the whole PATH, cached until PATH changes
+terminal = cached_guess_terminal()
 
 colors = [
     ["#00000000", "#00000000"], #0 full transparent
@@ -105,7 +118,7 @@ keys = [
         lazy.layout.toggle_split(),
         desc="Toggle between split and unsplit sides of stack",
     ),
-    Key([mod], "Return", lazy.spawn(terminal), desc="Launch terminal"),
+    Key([mod], "Return", lazy.function(spawner.spawn, terminal), desc="Launch terminal"),
     # Toggle between different layouts as defined below
     Key([mod], "Tab", lazy.next_layout(), desc="Toggle between layouts"),
     Key([mod], "w", lazy.window.kill(), desc="Kill focused window"),
@@ -116,7 +129,9 @@ keys = [
         desc="Toggle fullscreen on the focused window",
     ),
     Key([mod], "f", lazy.window.toggle_floating(), desc="Toggle floating on the focused window"),
-    Key([mod, "control"], "r", lazy.reload_config(), desc="Reload the config"),
+    # only applies what changed, see modules/incremental.py
+    Key([mod, "control"], "r", lazy.function(incremental.reload_config), desc="Reload the config"),
+    Key([mod, "control", "shift"], "r", lazy.reload_config(), desc="Reload the whole config"),
     Key([mod, "control"], "q", lazy.shutdown(), desc="Shutdown Qtile"),
     Key([mod], "r", lazy.spawncmd(), desc="Spawn a command using a prompt widget"),
         #JIA additions
@@ -133,10 +148,11 @@ keys = [
     desc='Focus to monitor 2'
     ),
 
-    Key([mod],"l", lazy.spawn('xsecurelock')),
+    # slows the bar sampler down while the screen is locked
+    Key([mod],"l", lazy.function(sampler.lock_screen)),
 #    Key([mod], "361u", lazy.spawn('flameshot gui')),
-    Key([mod],"p", lazy.spawn('/home/julien/scripts/flameshot_gui.sh')),
-    Key([mod],"v", lazy.spawn('copyq toggle')),
+    Key([mod],"p", lazy.function(spawner.spawn, '/home/julien/scripts/flameshot_gui.sh')),
+    Key([mod],"v", lazy.function(spawner.spawn, 'copyq toggle')),
 
 ]
 
@@ -153,12 +169,14 @@ for vt in range(1, 8):
         )
     )
 
+profiling.mark("keys")
 
 #groups = [Group(i) for i in "123456789"]
 groups = [
 #        Group(name="1", screen_affinity=1, matches=[Match(wm_class='VirtualBox Machine'), Match(wm_class='VirtualBox Manager'), Match=(wm_class=re.compile('.*remmina|Remmina.*'))]),
-        Group(name="1", screen_affinity=1, matches=[Match(wm_class=re.compile('.*remmina|Remmina.*')),Match(wm_class=re.compile('.*VirtualBox.*')),Match(wm_class=re.compile('.*irt-manager,*'))],
-              layouts = [layout.MonadTall(
+        # compile_rules merges the regexes and memoizes per window (modules/rules.py)
+        Group(name="1", screen_affinity=1, matches=[rules.compile_rules([Match(wm_class=re.compile('.*remmina|Remmina.*')),Match(wm_class=re.compile('.*VirtualBox.*')),Match(wm_class=re.compile('.*irt-manager,*'))])],
+              layouts = [tiling.MonadTall(
         ratio=0.62,
         margin=6,
         border_width=4,
@@ -166,7 +184,7 @@ groups = [
         new_client_position='after_current',
     ),
     layout.Max(),
-    layout.Columns(border_focus=colors[2], border_width=5, margin=5),
+    tiling.Columns(border_focus=colors[2], border_width=5, margin=5),
 ]
               ),    
 #    Group(name="1", screen_affinity=1, matches=Match(wm_class=[re.compile('.*remmina|Remmina.*'), 'firefox'])),
@@ -179,19 +197,19 @@ groups = [
     Group(name="5"),
     Group(name="6"),
     Group(name="7"),
-    Group(name="8", matches=[Match(wm_class=["keepassxc"])]),
-    Group(name="9", matches=[Match(wm_class=re.compile('.*teams.*'))]),
+    Group(name="8", matches=[rules.compile_rules([Match(wm_class="keepassxc")])]),
+    Group(name="9", matches=[rules.compile_rules([Match(wm_class=re.compile('.*teams.*'))])]),
 ]
 
 
 for i in groups:
     keys.extend(
         [
-            # mod1 + group number = switch to group
+            # mod1 + group number = switch to group, in one batch (modules/groupswitch.py)
             Key(
                 [mod],
                 i.name,
-                lazy.group[i.name].toscreen(),
+                lazy.function(groupswitch.toscreen, i.name),
                 desc="Switch to group {}".format(i.name),
             ),
             # mod1 + shift + group number = switch to & move focused window to group
@@ -207,9 +225,10 @@ for i in groups:
             #     desc="move focused window to group {}".format(i.name)),
         ]
     )
+profiling.mark("groups")
 
 layouts = [
-    layout.MonadTall(
+    tiling.MonadTall(
         ratio=0.62,
         margin=6,
         border_width=4,
@@ -217,7 +236,7 @@ layouts = [
         new_client_position='top',
     ),
     layout.Max(),
-    layout.Columns(border_focus=colors[2], border_width=5, margin=5),
+    tiling.Columns(border_focus=colors[2], border_width=5, margin=5),
     # Try more layouts by unleashing below layouts.
     # layout.Stack(num_stacks=2),
     # layout.Bsp(),
@@ -237,10 +256,15 @@ widget_defaults = dict(
 )
 extension_defaults = widget_defaults.copy()
 
+# resolve the .when() guards per layout and backend ahead of the key press,
+# see modules/dispatch.py
+dispatch.compile_keys(keys, layouts + [l for g in groups for l in g.layouts])
+profiling.mark("layouts")
+
 screens = [
     #main screen
     Screen(
-        top=bar.Bar(
+        top=redraw.CoalescingBar(
             [
                 widget.Sep(
                     linewidth=1,
@@ -249,7 +273,7 @@ screens = [
                     background=colors[16],
                 ),
 
-                widget.Image(
+                imagecache.CachedImage(
                     filename="/home/julien/pictures/jia.png",
                     iconsize=9,
                     background=colors[16],
@@ -266,7 +290,7 @@ screens = [
                     other_current_screen_border=colors[11],
                     urgent_border=colors[6],
                 ),
-                widget.TaskList(
+                tasklist.CoalescingTaskList(
                     highlight_method='border',
                     icon_size=20,
                     max_title_width=150,
@@ -280,13 +304,13 @@ screens = [
                     borderwidth=1,
                     background=colors[17],
                 ),
-                widget.Prompt(
+                completion.Prompt(
                     background=colors[17],
                 ),
                 widget.Spacer(
                     background=colors[17],
                     length=40),
-                widget.CurrentLayoutIcon(
+                imagecache.CachedCurrentLayoutIcon(
                     background=colors[17],
                 ),
                 widget.CurrentLayout(
@@ -320,52 +344,34 @@ screens = [
                 widget.Spacer(
                     background=colors[17],
                     length=20),
-                widget.Wlan(                    
+                # Wlan, Net and Memory share one /proc sampler (modules/sampler.py)
+                sampler.WlanText(
+                    interface="wlan0",
                     format='{essid} {percent:2.0%}',
-#                    background=colors[5],
-                    background=colors[17],                    
+                    background=colors[17],
                 ),
-                widget.Net(
+                sampler.NetText(
                     interface="wlan0",
                     format='{down:.0f}{down_suffix} ↓↑ {up:.0f}{up_suffix}',
-#                    background=colors[5],
                     background=colors[17],
                 ),
-                widget.Memory(
+                sampler.MemoryText(
                     background=colors[17],
                     format='Mem{MemPercent}%',
-#                    background=colors[9],
                 ),
 #                widget.Spacer(length=20),
-                widget.Clock(
-                    format="%H:%M",
-                    timezone=pytz.timezone("America/Mexico_City"),
-                    foreground=colors[10],
-#                    background=colors[8],
-                    background=colors[17],
-                ),
-                widget.Clock(
-                    format="%H:%M",
-                    timezone=pytz.timezone("America/New_York"),
-                    foreground=colors[12],
-                    background=colors[17],
-                ),
-                widget.Clock(
-                    format="%Y-%m-%d %a %H:%M",
+                # one shared, minute aligned timer for every clock of every bar
+                clock.MultiClock(
+                    clocks=[
+                        ("%H:%M", "America/Mexico_City", colors[10]),
+                        ("%H:%M", "America/New_York", colors[12]),
+                        ("%Y-%m-%d %a %H:%M", None, None),
+                        ("%H:%M", "Asia/Calcutta", colors[13]),
+                        ("%H:%M", "Australia/Sydney", colors[6]),
+                    ],
+                    separator="  ",
                     background=colors[17],
                 ),
-                widget.Clock(
-                    format="%H:%M",
-                    timezone=pytz.timezone("Asia/Calcutta"),
-                    foreground=colors[13],
-                    background=colors[17],
-                ),
-                widget.Clock(
-                    format="%H:%M",
-                    timezone=pytz.timezone("Australia/Sydney"),
-                    foreground=colors[6],
-                    background=colors[17],
-                ),                
 #                widget.Notify(
 #                    size=48,
 #                    scroll=True,
@@ -373,21 +379,33 @@ screens = [
 #                    #height=100,
 #                    #scroll_fixed_width=True,
 #                ),
-                widget.GenPollText(
+#                widget.GenPollText(
+#                    name="do not disturb status",
+#                    update_interval=5,
+#                    foreground=colors[14], background=colors[17],
+#                    fontsize=10,
+#                    func=lambda: subprocess.check_output("/home/julien/scripts/get-dunst-pause-status.sh").decode("utf-8"),
+#                ),
+                # listens to dunst on D-Bus instead of forking a script every 5s
+                dunst.DunstStatus(
                     name="do not disturb status",
-                    update_interval=5,
+                    paused_text="DND on",
+                    running_text="DND off",
+                    toggle_command=["/home/julien/scripts/toggle_pause_on_dunst.sh"],
                     foreground=colors[14], background=colors[17],
                     fontsize=10,
-                    func=lambda: subprocess.check_output("/home/julien/scripts/get-dunst-pause-status.sh").decode("utf-8"),
                 ),
-                widget.LaunchBar(
+                imagecache.CachedLaunchBar(
                     background=colors[17],
-                    progs=[('/home/julien/.local/share/icons/do-not-disturb-OFF.png','/home/julien/scripts/toggle_pause_on_dunst.sh','Do Not Disturb OFF')]
+                    # goes through the status widget so the text follows the toggle right away
+                    progs=[('/home/julien/.local/share/icons/do-not-disturb-OFF.png','qshell:self.qtile.widgets_map["do not disturb status"].toggle()','Do Not Disturb OFF')]
                 ),
-                widget.Systray(
+                # docks are batched and the width kept for the eight autostart applets
+                systray.BatchedSystray(
                     background=colors[16],
+                    reserved_icons=8,
                 ),
-                widget.Battery(
+                sampler.BatteryText(
                     background=colors[16],
                     format='{char}{percent:2.0%}'),
 #                widget.QuickExit(),
@@ -396,14 +414,12 @@ screens = [
 #            opacity=0.9,
             background = colors[16],
         ),
-        # You can uncomment this variable if you see that on X11 floating resize/moving is laggy
-        # By default we handle these events delayed to already improve performance, however your system might still be struggling
-        # This variable is set to None (no cap) by default, but you can set it to 60 to indicate that you limit it to 60 events per second
-        # x11_drag_polling_rate = 60,
+        # Floating moves and resizes are paced to the refresh rate of each
+        # monitor by modules/drag.py, leave x11_drag_polling_rate unset
     ),
     #2nd screen
         Screen(
-        top=bar.Bar(
+        top=redraw.CoalescingBar(
             [
                 widget.Sep(
                     linewidth=1,
@@ -412,7 +428,7 @@ screens = [
                     background=colors[0],
                 ),
 
-                widget.Image(
+                imagecache.CachedImage(
                     filename="/home/julien/pictures/jia.png",
                     iconsize=9,
                     background=colors[0],
@@ -428,7 +444,7 @@ screens = [
                     other_current_screen_border=colors[11],
                     urgent_border=colors[6],
                 ),
-                widget.TaskList(
+                tasklist.CoalescingTaskList(
                     highlight_method='border',
                     icon_size=20,
                     max_title_width=150,
@@ -442,18 +458,18 @@ screens = [
                     borderwidth=1,
                     background=colors[0],
                 ),
-                widget.Prompt(),
+                completion.Prompt(),
                 widget.Spacer(length=40),
-                widget.CurrentLayoutIcon(),
+                imagecache.CachedCurrentLayoutIcon(),
                 widget.CurrentLayout(),
-                widget.Clock(
-                    format="%Y-%m-%d %a %H:%M",
+                clock.MultiClock(
+                    clocks=[("%Y-%m-%d %a %H:%M", None, None)],
                     background=colors[17],
-                ),                
+                ),
                 ],24)),
 #third screen
     Screen(
-        top=bar.Bar(
+        top=redraw.CoalescingBar(
             [
                 widget.Sep(
                     linewidth=1,
@@ -462,7 +478,7 @@ screens = [
                     background=colors[0],
                 ),
 
-                widget.Image(
+                imagecache.CachedImage(
                     filename="/home/julien/pictures/jia.png",
                     iconsize=9,
                     background=colors[0],
@@ -478,7 +494,7 @@ screens = [
                     other_current_screen_border=colors[11],
                     urgent_border=colors[6],
                 ),
-                widget.TaskList(
+                tasklist.CoalescingTaskList(
                     highlight_method='border',
                     icon_size=20,
                     max_title_width=150,
@@ -492,32 +508,37 @@ screens = [
                     borderwidth=1,
                     background=colors[0],
                 ),
-                widget.Prompt(),
+                completion.Prompt(),
                 widget.Spacer(length=40),
-                widget.CurrentLayoutIcon(),
+                imagecache.CachedCurrentLayoutIcon(),
                 widget.CurrentLayout(),
-                widget.Clock(
-                    format="%Y-%m-%d %a %H:%M",
+                clock.MultiClock(
+                    clocks=[("%Y-%m-%d %a %H:%M", None, None)],
                     background=colors[17],
-                ),                
+                ),
                 ],24)),
 ]
+profiling.mark("screens")
 
-# Drag floating layouts.
+# Drag floating layouts, at the refresh rate of the monitor under the pointer.
 mouse = [
-    Drag([mod], "Button1", lazy.window.set_position_floating(), start=lazy.window.get_position()),
-    Drag([mod], "Button3", lazy.window.set_size_floating(), start=lazy.window.get_size()),
+    Drag([mod], "Button1", lazy.function(drag.move_floating), start=lazy.window.get_position()),
+    Drag([mod], "Button3", lazy.function(drag.resize_floating), start=lazy.window.get_size()),
     Click([mod], "Button2", lazy.window.bring_to_front()),
 ]
 
 dgroups_key_binder = None
 dgroups_app_rules = []  # type: list
-follow_mouse_focus = True
+# focus follows the mouse once it settles instead of on every window it
+# crosses, see modules/mousefocus.py
+follow_mouse_focus = False
+focus_mouse_dwell_ms = 80
+focus_mouse_min_distance = 40
 bring_front_click = False
 floats_kept_above = True
 cursor_warp = False
 floating_layout = layout.Floating(
-    float_rules=[
+    float_rules=[rules.compile_rules([
         # Run the utility of `xprop` to see the wm class and name of an X client.
         *layout.Floating.default_float_rules,
         Match(wm_class="confirmreset"),  # gitk
@@ -526,7 +547,7 @@ floating_layout = layout.Floating(
         Match(wm_class="ssh-askpass"),  # ssh-askpass
         Match(title="branchdialog"),  # gitk
         Match(title="pinentry"),  # GPG key password entry
-    ]
+    ])]
 )
 auto_fullscreen = True
 focus_on_window_activation = "smart"
@@ -549,7 +570,37 @@ wl_input_rules = None
 # java that happens to be on java's whitelist.
 wmname = "LG3D"
 
+# A new random wallpaper per screen every 30 minutes, scaled once per output
+# size and cached (modules/wallpaper.py), instead of feh in the autostart
+wallpaper.start("/home/julien/wallpapers", interval=30 * 60)
+
+# What used to be autostart.sh, with an order: compositor and notifications
+# first, then the tray apps, then the heavy ones one after the other.
+# Timings end up in ~/.cache/qtile/autostart.json
+autostart_apps = [
+    autostart.App("picom", "picom -f", ready=autostart.compositor_running, priority=0),
+    autostart.App("dunst", "dunst", ready="dbus:org.freedesktop.Notifications", priority=0),
+    autostart.App("nm-applet", "nm-applet", after=["picom", "dunst"], ready="tray", priority=1),
+    autostart.App("blueman-applet", "blueman-applet", after=["picom", "dunst"], ready="tray", priority=1, wm_class=["blueman-applet", "blueman-tray"]),
+    autostart.App("copyq", "copyq --start-server", after=["picom", "dunst"], ready="tray", priority=1),
+    autostart.App("kwallet", "kwallet-query -l kdewallet", after=["dunst"], ready="exit", priority=1, timeout=120),
+    autostart.App("keepassxc", "keepassxc", after=["kwallet"], ready="tray", priority=2),
+    autostart.App("flameshot", "flameshot", after=["picom", "dunst"], ready="tray", priority=2),
+    autostart.App("nextcloud", "nextcloud", after=["picom", "dunst"], ready="tray", priority=2),
+    autostart.App("emacs", "emacs --daemon --init-directory /home/julien", ready="exit", priority=3, heavy=True, timeout=60),
+    autostart.App("teams", "teams", after=["nm-applet"], ready="window", priority=4, heavy=True, timeout=60),
+    autostart.App("virt-manager", "virt-manager", after=["picom"], ready="window", priority=4, heavy=True),
+    autostart.App("remmina", "remmina", after=["picom"], ready="window", priority=4, heavy=True),
+]
+
 @hook.subscribe.startup_once
-def autostart():
-    home = os.path.expanduser('~/.config/qtile/autostart.sh')
-    subprocess.Popen([home])
+def autostart_session():
+    # set by bench/bench_latency.py
+    if os.environ.get("QTILE_NO_AUTOSTART"):
+        return
+    autostart.Supervisor(autostart_apps, max_parallel=3).start(qtile)
+
+profiling.mark("rest")
+
+# what the next mod+control+r compares against
+incremental.snapshot(globals())
@@ -0,0 +1 @@
+"""Helpers imported by config.py (widgets, services and hooks)."""
@@ -0,0 +1,239 @@
+"""Dependency-aware autostart.
+
+Replaces the fire-and-forget ``autostart.sh``: each ``App`` declares what it
+waits for (``after``) and how to tell it is up (``ready``). The supervisor
+starts apps in priority order, never has more than ``max_parallel`` of them
+starting at the same time, spaces heavy apps out, and writes a timing report
+(spawn, ready, first window, tray icon) to the qtile cache directory.
+
+``ready`` is one of:
+
+- ``"spawn"``: ready as soon as the process is started;
+- ``"exit"``: ready when the process exits (one-shot commands, daemons that
+  fork like ``emacs --daemon``);
+- ``"window"``: ready when it maps its first window;
+- ``"tray"``: ready when its icon shows up in the systray;
+- ``"dbus:<name>"``: ready when ``<name>`` appears on the session bus, asked
+  with ``NameHasOwner`` over one connection shared by all polls;
+- a callable taking ``qtile`` and returning True once ready.
+"""
+
+import asyncio
+import json
+import os
+import time
+
+from libqtile import hook
+from libqtile.log_utils import logger
+from libqtile.utils import _send_dbus_message, create_task, get_cache_dir
+
+from modules import spawner
+
+try:
+    from dbus_fast.constants import MessageType
+
+    has_dbus = True
+except ImportError:
+    has_dbus = False
+
+REPORT = os.path.join(get_cache_dir(), "autostart.json")
+
+
+class App:
+    def __init__(
+        self,
+        name,
+        cmd,
+        after=(),
+        ready="spawn",
+        priority=0,
+        heavy=False,
+        wm_class=None,
+        timeout=30,
+        shell=False,
+    ):
+        self.name = name
+        self.cmd = cmd
+        self.shell = shell
+        self.after = tuple(after)
+        self.ready = ready
+        self.priority = priority
+        self.heavy = heavy
+        # used to recognise the app's windows and tray icon besides its pid; a
+        # sequence when the tray icon has a class of its own (blueman-tray)
+        if wm_class is None or isinstance(wm_class, str):
+            wm_class = [wm_class or name]
+        self.wm_classes = {c.lower() for c in wm_class}
+        self.timeout = timeout
+        self.pid = None
+        self.times = {}
+        self.done = asyncio.Event()
+
+
+def compositor_running(qtile):
+    """Readiness check for picom: somebody owns the compositing selection."""
+    conn = qtile.core.conn
+    owner = conn.conn.core.GetSelectionOwner(conn.atoms["_NET_WM_CM_S0"]).reply().owner
+    return owner != 0
+
+
+def _ancestors(pid, depth=4):
+    """The parent pids of ``pid``, nearest first."""
+    parents = []
+    for _ in range(depth):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                pid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            break
+        if pid <= 1:
+            break
+        parents.append(pid)
+    return parents
+
+
+class Supervisor:
+    def __init__(self, apps, max_parallel=3, heavy_delay=2.0, poll_interval=0.2):
+        self.apps = {app.name: app for app in apps}
+        self.max_parallel = max_parallel
+        self.heavy_delay = heavy_delay
+        self.poll_interval = poll_interval
+        self.qtile = None
+        self.started = None
+        self._last_heavy = 0.0
+        self._bus = None
+        for app in apps:
+            for dep in app.after:
+                if dep not in self.apps:
+                    raise ValueError(f"autostart: {app.name} waits for unknown app {dep}")
+
+    def start(self, qtile):
+        self.qtile = qtile
+        self.started = time.monotonic()
+        hook.subscribe.client_new(self._client_new)
+        create_task(self._run())
+
+    def _elapsed(self):
+        return round(time.monotonic() - self.started, 3)
+
+    def _owner(self, window):
+        # a client has get_pid, the XWindow of a tray icon get_net_wm_pid
+        get_pid = getattr(window, "get_pid", None) or getattr(window, "get_net_wm_pid", None)
+        pid = get_pid() if get_pid is not None else None
+        wm_class = {c.lower() for c in (window.get_wm_class() or [])}
+        ancestors = _ancestors(pid) if pid else ()
+        for app in self.apps.values():
+            if app.pid is None:
+                continue
+            # applets often dock their icon from a child process (blueman-tray)
+            if app.pid == pid or app.pid in ancestors or app.wm_classes & wm_class:
+                return app
+        return None
+
+    def _client_new(self, client):
+        app = self._owner(client)
+        if app is not None and "first_window" not in app.times:
+            app.times["first_window"] = self._elapsed()
+
+    def _check_tray(self, app):
+        systray = self.qtile.widgets_map.get("systray")
+        for icon in getattr(systray, "tray_icons", ()):
+            if self._owner(icon.window) is app:
+                app.times.setdefault("tray", self._elapsed())
+                return True
+        return False
+
+    def _alive(self, app):
+        return os.path.exists(f"/proc/{app.pid}")
+
+    async def _is_ready(self, app):
+        ready = app.ready
+        if ready == "spawn":
+            return True
+        if ready == "exit":
+            return not self._alive(app)
+        if ready == "window":
+            return "first_window" in app.times
+        if ready == "tray":
+            return self._check_tray(app)
+        if isinstance(ready, str) and ready.startswith("dbus:"):
+            return await self._dbus_name_owned(ready[5:])
+        return ready(self.qtile)
+
+    async def _dbus_name_owned(self, name):
+        if not has_dbus:
+            return False
+        # one session bus connection for every poll of every app
+        self._bus, msg = await _send_dbus_message(
+            True,
+            MessageType.METHOD_CALL,
+            "org.freedesktop.DBus",
+            "org.freedesktop.DBus",
+            "/org/freedesktop/DBus",
+            "NameHasOwner",
+            "s",
+            [name],
+            bus=self._bus,
+        )
+        if msg is None or msg.message_type != MessageType.METHOD_RETURN:
+            return False
+        return msg.body[0]
+
+    async def _wait_ready(self, app):
+        deadline = time.monotonic() + app.timeout
+        while time.monotonic() < deadline:
+            try:
+                if await self._is_ready(app):
+                    return True
+            except Exception:
+                logger.exception("autostart: readiness check failed for %s", app.name)
+                return False
+            await asyncio.sleep(self.poll_interval)
+        return False
+
+    async def _start(self, app, slots):
+        for dep in app.after:
+            await self.apps[dep].done.wait()
+        async with slots:
+            if app.heavy:
+                # spread heavy apps out so they don't fight over the disk and CPU
+                now = time.monotonic()
+                self._last_heavy = max(now, self._last_heavy + self.heavy_delay)
+                await asyncio.sleep(self._last_heavy - now)
+            app.times["spawn"] = self._elapsed()
+            app.pid = await spawner.spawn_async(self.qtile, app.cmd, shell=app.shell)
+            if app.pid == -1:
+                logger.warning("autostart: unable to start %s", app.name)
+                app.times["failed"] = True
+            elif await self._wait_ready(app):
+                app.times["ready"] = self._elapsed()
+            else:
+                logger.warning("autostart: %s not ready after %ss", app.name, app.timeout)
+                app.times["timeout"] = True
+        # dependents go ahead even on failure: a missing tray is better than no apps
+        app.done.set()
+
+    async def _run(self):
+        slots = asyncio.Semaphore(self.max_parallel)
+        # tasks queue on the semaphore in creation order, hence the sort
+        apps = sorted(self.apps.values(), key=lambda app: app.priority)
+        await asyncio.gather(*(self._start(app, slots) for app in apps))
+        if self._bus is not None:
+            self._bus.disconnect()
+            self._bus = None
+        # give the late windows and tray icons a chance to be recorded
+        await asyncio.sleep(max(app.timeout for app in apps))
+        for app in apps:
+            if app.pid not in (None, -1) and "tray" not in app.times:
+                self._check_tray(app)
+        self.write_report()
+
+    def write_report(self, path=REPORT):
+        report = {app.name: dict(app.times, cmd=app.cmd) for app in self.apps.values()}
+        try:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+        except OSError:
+            logger.exception("autostart: unable to write %s", path)
+        else:
+            logger.info("autostart: timing report written to %s", path)
@@ -0,0 +1,140 @@
+"""Several clocks driven by a single shared timer.
+
+Every ``MultiClock`` subscribes to the module level ``ticker``. The ticker
+wakes once per period (a minute when no subscribed format shows seconds,
+aligned to the wall clock boundary), converts each distinct timezone once and
+hands the results to all subscribers, so N clocks on M bars cost one wakeup.
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from libqtile import pangocffi
+from libqtile.command.base import expose_command
+from libqtile.log_utils import logger
+from libqtile.utils import hex
+from libqtile.widget import base
+
+# strftime directives that change more often than once a minute
+SECOND_DIRECTIVES = ("%S", "%s", "%f", "%c", "%T", "%X", "%r")
+
+# see libqtile.widget.clock: the loop may wake us a hair early
+DELTA = timedelta(seconds=0.5)
+
+
+class ClockTicker:
+    """One timer shared by every MultiClock of the session."""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.handle = None
+        self.ticks = 0
+
+    @property
+    def interval(self):
+        if any(w.needs_seconds for w in self.subscribers):
+            return 1
+        return 60
+
+    def subscribe(self, widget):
+        self.subscribers.add(widget)
+        # a seconds clock may have joined a minute ticker: re-align now
+        self._schedule(widget.qtile, 0)
+
+    def unsubscribe(self, widget):
+        self.subscribers.discard(widget)
+        if not self.subscribers and self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+    def _schedule(self, qtile, delay=None):
+        if self.handle is not None:
+            self.handle.cancel()
+        if delay is None:
+            interval = self.interval
+            delay = interval - time.time() % interval
+        self.handle = qtile.call_later(delay, self._tick, qtile)
+
+    def _tick(self, qtile):
+        self.handle = None
+        self.ticks += 1
+        now = datetime.now(timezone.utc) + DELTA
+        converted = {}
+        for widget in list(self.subscribers):
+            for zone in widget.zones:
+                if zone not in converted:
+                    converted[zone] = now.astimezone(zone)
+            try:
+                widget.tick(converted)
+            except Exception:
+                logger.exception("%s: failed to update", widget.name)
+        if self.subscribers:
+            self._schedule(qtile)
+
+
+ticker = ClockTicker()
+
+
+class MultiClock(base._TextBox):
+    """Renders several clocks, each with its own colour, in one text layout.
+
+    ``clocks`` is a list of ``(format, timezone, colour)`` tuples. The
+    timezone is an IANA name (``"Asia/Calcutta"``) or None for local time and
+    the colour may be None to use ``foreground``.
+    """
+
+    defaults = [
+        ("clocks", [("%H:%M", None, None)], "List of (format, timezone, colour) tuples."),
+        ("separator", " ", "Text put between two clocks."),
+    ]
+
+    def __init__(self, **config):
+        base._TextBox.__init__(self, "", **config)
+        self.add_defaults(MultiClock.defaults)
+        self.markup = True
+        self.segments = []
+        for fmt, zone, colour in self.clocks:
+            if isinstance(colour, list):
+                colour = colour[0]
+            self.segments.append(
+                (fmt, ZoneInfo(zone) if zone else None, hex(colour) if colour else None)
+            )
+        self.needs_seconds = any(
+            d in fmt for fmt, _, _ in self.segments for d in SECOND_DIRECTIVES
+        )
+
+    @property
+    def zones(self):
+        return [zone for _, zone, _ in self.segments]
+
+    def timer_setup(self):
+        # keep our own reference: a config reload rebinds the module global
+        self._ticker = ticker
+        self._ticker.subscribe(self)
+
+    def finalize(self):
+        if hasattr(self, "_ticker"):
+            self._ticker.unsubscribe(self)
+        base._TextBox.finalize(self)
+
+    def tick(self, converted):
+        parts = []
+        for fmt, zone, colour in self.segments:
+            # a None zone was converted to local time by astimezone()
+            now = converted[zone]
+            text = pangocffi.markup_escape_text(now.strftime(fmt))
+            if colour:
+                text = f'<span foreground="{colour}">{text}</span>'
+            parts.append(text)
+        self.update(self.separator.join(parts))
+
+    @expose_command()
+    def info(self):
+        d = base._TextBox.info(self)
+        d.update(
+            subscribers=len(self._ticker.subscribers),
+            ticks=self._ticker.ticks,
+            interval=self._ticker.interval,
+        )
+        return d
@@ -0,0 +1,373 @@
+"""Command completion from an index of PATH, ranked by use.
+
+The stock ``cmd`` completer globs every PATH directory each time Tab starts
+a new completion. ``PathIndex`` keeps the executables of PATH in a prefix
+trie:
+
+- it is saved to ``~/.cache/qtile/path-index.json`` with each directory's
+  mtime, and read back at startup. Directories whose mtime changed are
+  rescanned in a thread, so a cold disk only delays the first rescan, not
+  the completion;
+- inotify watches the PATH directories, and a directory that changes is
+  rescanned ``RESCAN_DELAY`` after its last event. The index and its watch
+  are kept across config reloads and closed at shutdown;
+- every command launched from the prompt gets a frecency score: a count that
+  halves every ``HALF_LIFE`` seconds. Completions come most used first, then
+  in alphabetical order.
+
+Until the index is loaded, and for paths (``~/``, ``/``), completion is the
+stock one. ``Prompt`` is ``widget.Prompt`` with this completer for ``cmd``,
+so ``lazy.spawncmd()`` uses it unchanged.
+"""
+
+import asyncio
+import ctypes
+import functools
+import json
+import os
+import struct
+import time
+
+from libqtile import hook
+from libqtile.log_utils import logger
+from libqtile.utils import get_cache_dir
+from libqtile.widget import prompt
+
+from modules import memory
+
+INDEX = os.path.join(get_cache_dir(), "path-index.json")
+HALF_LIFE = 14 * 24 * 3600
+RESCAN_DELAY = 0.5
+SAVE_DELAY = 5.0
+
+IN_ATTRIB = 0x4
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+WATCH_MASK = (
+    IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+EVENT = struct.Struct("iIII")
+
+
+class Trie:
+    """Prefix tree of command names; ``"\\0"`` marks the end of a name."""
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, word):
+        node = self.root
+        for char in word:
+            node = node.setdefault(char, {})
+        node["\0"] = True
+
+    def remove(self, word):
+        path = [self.root]
+        for char in word:
+            node = path[-1].get(char)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].pop("\0", None)
+        # prune the branches left empty
+        for depth in range(len(word), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][word[depth - 1]]
+
+    def prefixed(self, prefix):
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        words, stack = [], [(prefix, node)]
+        while stack:
+            word, node = stack.pop()
+            for char, child in node.items():
+                if char == "\0":
+                    words.append(word)
+                else:
+                    stack.append((word + char, child))
+        return words
+
+
+def scan(directory):
+    """``(mtime_ns, executable names)`` of a directory, None if it is not one."""
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+        with os.scandir(directory) as entries:
+            names = [
+                entry.name
+                for entry in entries
+                if entry.is_file() and os.access(entry.path, os.X_OK)
+            ]
+    except OSError:
+        return None
+    return mtime, names
+
+
+class PathIndex:
+    def __init__(self):
+        self.qtile = None
+        self.ready = False
+        self.path = None
+        self.dirs = {}  # directory -> [mtime_ns, names]
+        self.commands = {}  # name -> full path of the first directory that has it
+        self.trie = Trie()
+        self.frecency = {}  # name -> [score, last launch]
+        self.inotify = None
+        self.watches = {}  # watch descriptor -> directory
+        self.dirty = set()
+        self.rescan_timer = None
+        self.save_timer = None
+        self.stats = dict(lookups=0, rescans=0, events=0)
+
+    def _directories(self):
+        path = os.environ.get("PATH", prompt.CommandCompleter.DEFAULTPATH)
+        return [os.path.expanduser(d) for d in path.split(":") if d]
+
+    def start(self, qtile):
+        if self.qtile is not None:
+            return
+        self.qtile = qtile
+        try:
+            with open(INDEX) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = {}
+        self.frecency = saved.get("frecency", {})
+        directories = self._directories()
+        self.path = os.environ.get("PATH")
+        cached = saved.get("dirs", {})
+        self.dirs = {d: cached[d] for d in directories if d in cached}
+        if self.dirs:
+            # usable right away; the mtimes are checked in the background
+            self._rebuild()
+        self._watch(directories)
+        future = qtile.run_in_executor(self._check, directories)
+        future.add_done_callback(self._checked)
+
+    def _check(self, directories):
+        """In a thread: rescan the directories whose mtime is not the saved one."""
+        changed = {}
+        for directory in directories:
+            known = self.dirs.get(directory)
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                mtime = None
+            if known is None or known[0] != mtime:
+                changed[directory] = scan(directory)
+        return changed
+
+    def _checked(self, future):
+        try:
+            changed = future.result()
+        except Exception:
+            logger.exception("completion: unable to index PATH")
+            return
+        for directory, result in changed.items():
+            if result is None:
+                self.dirs.pop(directory, None)
+            else:
+                self.dirs[directory] = list(result)
+        self.stats["rescans"] += len(changed)
+        self._rebuild()
+        if changed:
+            self._save_soon()
+
+    def _rebuild(self):
+        commands = {}
+        for directory in self._directories():
+            _, names = self.dirs.get(directory, (None, ()))
+            for name in names:
+                commands.setdefault(name, os.path.join(directory, name))
+        for name in self.commands.keys() - commands.keys():
+            self.trie.remove(name)
+        for name in commands.keys() - self.commands.keys():
+            self.trie.add(name)
+        self.commands = commands
+        self.ready = True
+
+    def _watch(self, directories):
+        if self.inotify is None:
+            try:
+                libc = ctypes.CDLL(None, use_errno=True)
+                fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+                if fd < 0:
+                    raise OSError(ctypes.get_errno(), "inotify_init1")
+            except (OSError, AttributeError):
+                logger.info("completion: no inotify, PATH is checked when completing")
+                return
+            self.inotify = (libc, fd)
+            asyncio.get_running_loop().add_reader(fd, self._read_events)
+        libc, fd = self.inotify
+        for directory in directories:
+            wd = libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK)
+            if wd >= 0:
+                self.watches[wd] = directory
+
+    def _read_events(self):
+        _, fd = self.inotify
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size + length
+            directory = self.watches.get(wd)
+            if directory is not None:
+                self.dirty.add(directory)
+                self.stats["events"] += 1
+        if self.dirty:
+            if self.rescan_timer is not None:
+                self.rescan_timer.cancel()
+            self.rescan_timer = self.qtile.call_later(RESCAN_DELAY, self._rescan_dirty)
+
+    def _rescan_dirty(self):
+        self.rescan_timer = None
+        dirty, self.dirty = self.dirty, set()
+        future = self.qtile.run_in_executor(
+            lambda: {directory: scan(directory) for directory in dirty}
+        )
+        future.add_done_callback(self._checked)
+
+    def refresh(self):
+        """Catch up with a PATH change, or with directories changed without inotify."""
+        directories = self._directories()
+        if os.environ.get("PATH") != self.path:
+            self.path = os.environ.get("PATH")
+            self._watch([d for d in directories if d not in self.watches.values()])
+            self._checked(_Done(self._check(directories)))
+        elif self.inotify is None:
+            self._checked(_Done(self._check(directories)))
+
+    def score(self, name, now):
+        score, last = self.frecency.get(name, (0.0, now))
+        return score * 0.5 ** ((now - last) / HALF_LIFE)
+
+    def lookup(self, prefix):
+        """``[(name, full path)]`` starting with ``prefix``, best first."""
+        self.stats["lookups"] += 1
+        now = time.time()
+        names = self.trie.prefixed(prefix)
+        names.sort(key=lambda name: (-self.score(name, now), name))
+        return [(name, self.commands[name]) for name in names]
+
+    def launched(self, text):
+        words = text.split()
+        if not words or words[0] not in self.commands:
+            return
+        name = words[0]
+        now = time.time()
+        self.frecency[name] = [self.score(name, now) + 1, now]
+        self._save_soon()
+
+    def _save_soon(self):
+        if self.save_timer is None and self.qtile is not None:
+            self.save_timer = self.qtile.call_later(SAVE_DELAY, self.save)
+
+    def save(self):
+        self.save_timer = None
+        try:
+            os.makedirs(os.path.dirname(INDEX), exist_ok=True)
+            with open(INDEX + ".tmp", "w") as f:
+                json.dump(dict(dirs=self.dirs, frecency=self.frecency), f)
+            os.replace(INDEX + ".tmp", INDEX)
+        except OSError:
+            logger.exception("completion: unable to write %s", INDEX)
+
+    def stop(self):
+        """Stop watching PATH, write a pending save."""
+        for timer in (self.rescan_timer, self.save_timer):
+            if timer is not None:
+                timer.cancel()
+        self.rescan_timer = None
+        if self.save_timer is not None:
+            self.save()
+        if self.inotify is not None:
+            _, fd = self.inotify
+            asyncio.get_running_loop().remove_reader(fd)
+            os.close(fd)
+            self.inotify = None
+            self.watches = {}
+
+    def info(self):
+        return dict(
+            self.stats,
+            ready=self.ready,
+            commands=len(self.commands),
+            watched=len(self.watches),
+            ranked=len(self.frecency),
+        )
+
+
+class _Done:
+    """What ``_checked`` expects from a future, for results computed inline."""
+
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        return self._result
+
+
+# a config reload runs this module again: keep the index, its inotify fd and reader
+if "index" not in globals():
+    index = PathIndex()
+memory.register("completion.commands", index, lambda i: len(i.commands))
+memory.register("completion.frecency", index, lambda i: len(i.frecency))
+
+
+class IndexedCompleter(prompt.CommandCompleter):
+    """``cmd`` completion from ``index``, most launched first."""
+
+    def __init__(self, qtile, _testing=False):
+        prompt.CommandCompleter.__init__(self, qtile, _testing)
+        index.start(qtile)
+        index.refresh()
+
+    def complete(self, txt, aliases=None):
+        if self.lookup is not None or not index.ready or (txt and txt[0] in "~/"):
+            return prompt.CommandCompleter.complete(self, txt, aliases)
+        self.lookup = index.lookup(txt)
+        if aliases:
+            self.lookup += sorted((a, v) for a, v in aliases.items() if a.startswith(txt))
+        self.offset = -1
+        self.lookup.append((txt, txt))
+        return prompt.CommandCompleter.complete(self, txt, aliases)
+
+
+def _record_launch(callback, text):
+    index.launched(text)
+    callback(text)
+
+
+class Prompt(prompt.Prompt):
+    """``widget.Prompt`` completing commands from the PATH index."""
+
+    completers = dict(prompt.Prompt.completers, cmd=IndexedCompleter)
+
+    def start_input(self, prompt_text, callback, complete=None, *args, **kwargs):
+        if complete == "cmd":
+            callback = functools.partial(_record_launch, callback)
+        prompt.Prompt.start_input(self, prompt_text, callback, complete, *args, **kwargs)
+
+
+@hook.subscribe.startup_complete
+def _index_path():
+    from libqtile import qtile
+
+    index.start(qtile)
+
+
+@hook.subscribe.shutdown
+def _stop_index():
+    index.stop()
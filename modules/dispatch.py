@@ -0,0 +1,158 @@
+"""Key bindings resolved per layout and backend before they are pressed.
+
+On every key press qtile calls ``check`` on each command of the binding:
+the ``.when(layout=[...])`` of the grow bindings, the ``.when(func=...)``
+backend test of the VT bindings and the default ``func`` of every other
+command. ``compile_keys`` works out, once per layout, which commands of a
+binding apply; the first time a layout is used on a backend the ``func``
+guards are evaluated and the result is kept. When the layout, group or screen
+changes, each binding gets the command list of the current layout and
+backend, without the guards it no longer needs, so a press runs no
+predicates. Guards on the focused window or floating state still run on
+press.
+
+``compile_keys`` also reports, at load time:
+
+- ``lazy.layout`` commands that a layout does not have (``grow_left`` on
+  ``max``), which are left out instead of failing on press. A binding left
+  with no command still swallows the press;
+- ``.when(layout=...)`` names that are not a configured layout.
+
+``func`` guards are therefore expected to depend only on the layout and the
+backend. Key chords are left as they are.
+"""
+
+import copy
+
+from libqtile import hook
+from libqtile.config import Key
+from libqtile.lazy import lazy
+from libqtile.log_utils import logger
+
+stats = dict(rebuilds=0, skipped=0, tables=0)
+_applied = None
+
+
+def _key_name(key):
+    return "-".join([*key.modifiers, key.key])
+
+
+def _is_layout_command(cmd):
+    return [node for node, _ in cmd.selectors] == ["layout"]
+
+
+def _nothing(qtile):
+    pass
+
+
+# stands in for commands a layout lacks: qtile still swallows the press, as it
+# did when the command ran and failed
+_SWALLOW = lazy.function(_nothing)
+
+
+def _strip(cmd):
+    """A copy of ``cmd`` without the guards resolved by the table."""
+    stripped = copy.copy(cmd)
+    stripped._layouts = set()
+    stripped._condition = None
+    stripped._func = None
+    return stripped
+
+
+def compile_keys(keys, layouts):
+    """Prepare the per-layout commands of ``keys`` and report what cannot work.
+
+    ``layouts`` are all the layouts of the config, groups' own included.
+    """
+    by_name = {}
+    for layout in layouts:
+        by_name.setdefault(layout.name, []).append(layout)
+
+    missing = {}
+    unknown = set()
+    for key in keys:
+        if not isinstance(key, Key):
+            continue
+        per_layout = {}
+        dropped = set()
+        for name, instances in by_name.items():
+            commands = []
+            for cmd in key.commands:
+                if cmd._condition is False or (cmd._layouts and name not in cmd._layouts):
+                    continue
+                if _is_layout_command(cmd) and not all(i.command(cmd.name) for i in instances):
+                    missing.setdefault(name, []).append(f"{_key_name(key)} ({cmd.name})")
+                    dropped.add(name)
+                    continue
+                commands.append(cmd)
+            per_layout[name] = commands
+        for cmd in key.commands:
+            unknown |= cmd._layouts - by_name.keys()
+        key._dispatch = dict(
+            declared=list(key.commands), layouts=per_layout, dropped=dropped, resolved={}
+        )
+
+    for name, bindings in sorted(missing.items()):
+        logger.warning("keys: layout %s has no command for %s", name, ", ".join(bindings))
+    if unknown:
+        logger.warning("keys: .when(layout=...) names unknown layouts %s", sorted(unknown))
+    return keys
+
+
+def _resolve(key, layout, backend):
+    table = key._dispatch
+    resolved = table["resolved"].get((layout, backend))
+    if resolved is None:
+        commands = table["layouts"].get(layout)
+        if commands is None:
+            # a layout the config does not know, e.g. added from the command line
+            return table["declared"]
+        resolved = []
+        for cmd in commands:
+            if cmd._func is not None:
+                try:
+                    if not cmd._func():
+                        continue
+                except Exception:
+                    logger.exception("keys: guard of %s failed, keeping the command", cmd.name)
+            # guards on the window are only known on press and stay
+            resolved.append(_strip(cmd))
+        if not resolved and layout in table["dropped"]:
+            resolved = [_SWALLOW]
+        table["resolved"][(layout, backend)] = resolved
+        stats["tables"] += 1
+    return resolved
+
+
+def apply(qtile, force=False):
+    """Give every compiled binding the commands of the current layout and backend."""
+    global _applied
+    layout = qtile.current_layout
+    if layout is None:
+        return
+    current = (layout.name, qtile.core.name, id(qtile.config.keys))
+    if current == _applied and not force:
+        stats["skipped"] += 1
+        return
+    _applied = current
+    stats["rebuilds"] += 1
+    # keys_map is what a press is dispatched from; it can hold bindings of an
+    # older config.keys, e.g. after an incremental reload
+    keys = {id(key): key for key in (*qtile.config.keys, *qtile.keys_map.values())}
+    for key in keys.values():
+        if hasattr(key, "_dispatch"):
+            key.commands = _resolve(key, layout.name, qtile.core.name)
+
+
+# subscribed on import rather than by compile_keys, which the incremental
+# reload also runs on a trial load of config.py
+@hook.subscribe.setgroup
+@hook.subscribe.layout_change
+@hook.subscribe.current_screen_change
+def _rebuild(*args):
+    from libqtile import qtile
+
+    try:
+        apply(qtile)
+    except Exception:
+        logger.exception("keys: unable to rebuild the dispatch table")
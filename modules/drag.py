@@ -0,0 +1,206 @@
+"""Floating drags paced by the refresh rate of the monitor under the pointer.
+
+``Drag`` bindings run their command for every MotionNotify qtile handles, and
+``x11_drag_polling_rate`` caps that at one fixed rate for all screens. It also
+drops an event that comes too early instead of delaying it, so the window can
+stop short of where the pointer stopped.
+
+The commands below read the refresh rate of every CRTC through RandR (again
+on ``screen_change``). Motion is kept as the newest target only. The target is
+applied at most once per refresh of the monitor under the pointer, and always
+at the end of the frame it arrived in:
+
+- ``move_floating`` moves the window;
+- ``resize_floating`` only moves an outline, made of four thin windows, which
+  costs the client nothing. The window is resized once the pointer paused for
+  ``SETTLE`` seconds, which includes the end of the drag.
+
+Config::
+
+    Drag([mod], "Button1", lazy.function(drag.move_floating), start=lazy.window.get_position()),
+    Drag([mod], "Button3", lazy.function(drag.resize_floating), start=lazy.window.get_size()),
+
+Counters::
+
+    qtile cmd-obj -o root -f eval -a "__import__('modules.drag').drag.pacer.info()"
+"""
+
+import time
+
+from libqtile import hook
+from libqtile.log_utils import logger
+
+# when RandR has nothing to say (no extension, a mode without timings)
+DEFAULT_RATE = 60.0
+# pointer pause after which a resize is applied to the window
+SETTLE = 0.06
+OUTLINE_WIDTH = 2
+OUTLINE_COLOUR = "#ffffff"
+
+
+def mode_refresh(mode):
+    """Vertical refresh rate in Hz of a RandR ModeInfo, None without timings."""
+    import xcffib.randr
+
+    if not mode.htotal or not mode.vtotal:
+        return None
+    vtotal = mode.vtotal
+    if mode.mode_flags & xcffib.randr.ModeFlag.DoubleScan:
+        vtotal *= 2
+    if mode.mode_flags & xcffib.randr.ModeFlag.Interlace:
+        vtotal /= 2
+    return mode.dot_clock / (mode.htotal * vtotal)
+
+
+def query_refresh_rates(qtile):
+    """``[(x, y, width, height, Hz)]`` of the active CRTCs."""
+    if qtile.core.name != "x11":
+        return []
+    import xcffib
+    import xcffib.randr
+
+    conn = qtile.core.conn
+    ext = conn.conn(xcffib.randr.key)
+    resources = ext.GetScreenResourcesCurrent(conn.default_screen.root.wid).reply()
+    modes = {mode.id: mode for mode in resources.modes}
+    crtcs = [ext.GetCrtcInfo(crtc, resources.config_timestamp) for crtc in resources.crtcs]
+    rates = []
+    for cookie in crtcs:
+        info = cookie.reply()
+        if not info.mode or info.mode not in modes:
+            continue
+        rate = mode_refresh(modes[info.mode]) or DEFAULT_RATE
+        rates.append((info.x, info.y, info.width, info.height, rate))
+    return rates
+
+
+class DragPacer:
+    def __init__(self):
+        self.qtile = None
+        self.rates = None
+        self.pending = None
+        self.frame_timer = None
+        self.settle_timer = None
+        self.last_frame = 0.0
+        self.resize = None
+        self.outline = []
+        self.stats = dict(motions=0, frames=0, coalesced=0, moves=0, resizes=0, outlines=0)
+
+    def refresh_rates(self, qtile):
+        try:
+            self.rates = query_refresh_rates(qtile)
+        except Exception:
+            logger.exception("drag: unable to read the refresh rates, using %s Hz", DEFAULT_RATE)
+            self.rates = []
+
+    def rate_at(self, x, y):
+        for rx, ry, width, height, rate in self.rates:
+            if rx <= x < rx + width and ry <= y < ry + height:
+                return rate
+        return DEFAULT_RATE
+
+    def motion(self, qtile, kind, a, b):
+        window = qtile.current_window
+        if window is None:
+            return
+        self.qtile = qtile
+        if self.rates is None:
+            self.refresh_rates(qtile)
+        self.stats["motions"] += 1
+        if self.pending is not None:
+            self.stats["coalesced"] += 1
+        self.pending = (kind, window, a, b)
+
+        if qtile._drag is not None:
+            # (pointer x, pointer y, window x or w, window y or h, commands) at press
+            ox, oy, rx, ry, _ = qtile._drag
+            interval = 1 / self.rate_at(ox + a - rx, oy + b - ry)
+        else:
+            interval = 1 / DEFAULT_RATE
+        if kind == "resize":
+            self.resize = (window, a, b)
+            if self.settle_timer is not None:
+                self.settle_timer.cancel()
+            self.settle_timer = qtile.call_later(SETTLE, self._settle)
+        if self.frame_timer is None:
+            delay = max(0.0, self.last_frame + interval - time.monotonic())
+            self.frame_timer = qtile.call_later(delay, self._frame)
+
+    def _alive(self, window):
+        return window.wid in self.qtile.windows_map
+
+    def _frame(self):
+        self.frame_timer = None
+        self.last_frame = time.monotonic()
+        pending, self.pending = self.pending, None
+        if pending is None:
+            return
+        kind, window, a, b = pending
+        if not self._alive(window):
+            return
+        self.stats["frames"] += 1
+        if kind == "move":
+            self.stats["moves"] += 1
+            window.set_position_floating(a, b)
+        else:
+            border = 2 * window.borderwidth
+            self._show_outline(window.x, window.y, a + border, b + border)
+
+    def _settle(self):
+        self.settle_timer = None
+        resize, self.resize = self.resize, None
+        self._hide_outline()
+        if resize is None:
+            return
+        window, width, height = resize
+        if self._alive(window):
+            self.stats["resizes"] += 1
+            window.set_size_floating(width, height)
+
+    def _show_outline(self, x, y, width, height):
+        line = OUTLINE_WIDTH
+        edges = [
+            (x, y, width, line),
+            (x, y + height - line, width, line),
+            (x, y, line, height),
+            (x + width - line, y, line, height),
+        ]
+        if not self.outline:
+            core = self.qtile.core
+            pixel = core.conn.color_pixel(OUTLINE_COLOUR)
+            for edge in edges:
+                # root depth, so the pixel of the default colormap is opaque
+                internal = core.create_internal(*edge, desired_depth=24)
+                internal.window.set_attribute(backpixel=pixel)
+                internal.unhide()
+                self.outline.append(internal)
+        for internal, edge in zip(self.outline, edges):
+            internal.place(*edge, 0, None, above=True)
+        self.stats["outlines"] += 1
+
+    def _hide_outline(self):
+        outline, self.outline = self.outline, []
+        for internal in outline:
+            internal.kill()
+
+    def info(self):
+        return dict(self.stats, rates=self.rates)
+
+
+pacer = DragPacer()
+
+
+def move_floating(qtile, x, y):
+    """``lazy.window.set_position_floating`` paced to the monitor's refresh rate."""
+    pacer.motion(qtile, "move", x, y)
+
+
+def resize_floating(qtile, width, height):
+    """``lazy.window.set_size_floating`` through an outline, applied once the pointer rests."""
+    pacer.motion(qtile, "resize", width, height)
+
+
+@hook.subscribe.screen_change
+def _screen_change(event):
+    # read again on the next drag, the new modes may not be set yet
+    pacer.rates = None
@@ -0,0 +1,108 @@
+"""Group switches applied in one go.
+
+``toscreen`` pulls a group to the current screen, like
+``lazy.group[name].toscreen()``, but inside a server grab. The unmaps, maps,
+ConfigureWindows, border repaints and focus change of the switch are
+buffered by qtile and flushed before ``UngrabServer``, so the X server
+applies them as one batch and no client or compositor paints in between.
+
+Hidden groups are laid out ahead of time: when a window is added to or
+removed from a group that is not shown, its layout is re-run without mapping
+anything (``tiling``'s ``prelayout``) for the screen it will be shown on: the
+one of its ``screen_affinity``, or else the current screen. When the group is
+pulled to that screen, its windows already have their size and only need to
+be mapped. Config::
+
+    Key([mod], "1", lazy.function(groupswitch.toscreen, "1")),
+
+``qtile cmd-obj -o root -f eval -a "__import__('modules.groupswitch').groupswitch.stats"``
+"""
+
+import contextlib
+import time
+
+from libqtile import hook
+from libqtile.log_utils import logger
+
+stats = dict(switches=0, prelayouts=0, last_switch_ms=None)
+_pending = set()
+
+
+@contextlib.contextmanager
+def server_grab(qtile):
+    """Hold the X server for the requests sent inside the block."""
+    if qtile.core.name != "x11":
+        yield
+        return
+    conn = qtile.core.conn
+    conn.conn.core.GrabServer()
+    try:
+        yield
+    finally:
+        conn.conn.core.UngrabServer()
+        conn.flush()
+
+
+def toscreen(qtile, name, toggle=False):
+    """``group[name].toscreen()`` as one server-grabbed batch."""
+    group = qtile.groups_map.get(name)
+    if group is None:
+        logger.warning("groupswitch: no group %s", name)
+        return
+    start = time.perf_counter()
+    with server_grab(qtile):
+        group.toscreen(toggle=toggle)
+    stats["switches"] += 1
+    stats["last_switch_ms"] = round((time.perf_counter() - start) * 1000, 3)
+
+
+def _target_screen(qtile, group):
+    """The screen ``group`` is expected to be shown on."""
+    affinity = getattr(group, "screen_affinity", None)
+    if affinity is not None and 0 <= affinity < len(qtile.screens):
+        return qtile.screens[affinity]
+    return qtile.current_screen
+
+
+def prelayout(qtile, group):
+    layout = group.layout
+    if group.screen is not None or not hasattr(layout, "prelayout"):
+        return
+    normal = [w for w in group.windows if not w.floating]
+    if not normal:
+        return
+    layout.prelayout(normal, _target_screen(qtile, group).get_rect())
+    stats["prelayouts"] += 1
+
+
+def _flush():
+    from libqtile import qtile
+
+    groups = list(_pending)
+    _pending.clear()
+    for group in groups:
+        try:
+            prelayout(qtile, group)
+        except Exception:
+            logger.exception("groupswitch: unable to lay out group %s", group.name)
+
+
+def _schedule(group):
+    from libqtile import qtile
+
+    if group is None or group.screen is not None:
+        return
+    if not _pending:
+        # once the event is handled: a window being managed is not placed yet
+        qtile.call_soon(_flush)
+    _pending.add(group)
+
+
+@hook.subscribe.group_window_add
+def _window_added(group, window):
+    _schedule(group)
+
+
+@hook.subscribe.group_window_remove
+def _window_removed(group, window):
+    _schedule(group)
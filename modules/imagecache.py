@@ -0,0 +1,281 @@
+"""Decoded and scaled images shared by every bar.
+
+Each bar has its own ``Image`` of the same logo, its own ``TaskList`` and
+``CurrentLayoutIcon``: without sharing, the logo and the layout icons are
+decoded once per bar and a window icon is fetched and scaled again by every
+task list it shows up in. ``SurfaceCache`` is a size-bounded LRU of cairo
+surfaces used by the widgets below:
+
+- files are keyed on ``(path, mtime, size, rotation)``, so an edited file is
+  decoded again;
+- window icons are keyed on ``(window id, icon hash, size, theme mode)``. The
+  hash of a window's icons is computed once per ``net_wm_icon_change``.
+
+Entries are never ``finish()``ed on eviction: a widget may still paint
+from one, the surface goes away with its last reference. ``info`` on the
+widgets (``qtile cmd-obj -o widget tasklist -f info``) shows the cache
+hits, misses and memory footprint.
+"""
+
+import os
+import sys
+from collections import OrderedDict
+
+import cairocffi
+
+from libqtile import hook
+from libqtile.command.base import expose_command
+from libqtile.images import Img
+from libqtile.log_utils import logger
+from libqtile.widget import CurrentLayoutIcon, Image, LaunchBar, TaskList
+
+from modules import memory
+
+
+def _surface_bytes(surface):
+    return surface.get_stride() * surface.get_height()
+
+
+class SurfaceCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, build):
+        """Return the cached value for ``key``, or ``build() -> (value, size)``.
+
+        A None value is cached too, so that what cannot be built is not tried again.
+        """
+        try:
+            value, size = self.entries[key]
+        except KeyError:
+            pass
+        else:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value, size = build()
+        self.entries[key] = (value, size)
+        self.bytes += size
+        self.trim()
+        return value
+
+    def trim(self):
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def discard(self, predicate):
+        for key in [key for key in self.entries if predicate(key)]:
+            _, size = self.entries.pop(key)
+            self.bytes -= size
+
+    def image(self, path, width=None, height=None, theta=0.0):
+        """An ``Img`` of ``path`` resized to ``width`` and/or ``height``.
+
+        The ``Img`` is shared: callers must not resize or rotate it.
+        """
+        path = os.path.expanduser(path)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            logger.warning("Image does not exist: %s", path)
+            return None
+
+        def build():
+            img = Img.from_path(path)
+            if width is not None or height is not None:
+                img.resize(width=width, height=height)
+            img.theta = theta
+            img.pattern
+            # resize() decoded the image at its full size to learn it
+            img.__dict__.pop("_default_surface", None)
+            return img, _surface_bytes(img.surface) + len(img.bytes_img)
+
+        return self.get(("file", path, mtime, width, height, theta), build)
+
+    def info(self):
+        return dict(
+            entries=len(self.entries),
+            bytes=self.bytes,
+            max_bytes=self.max_bytes,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+        )
+
+
+cache = SurfaceCache()
+memory.register(
+    "imagecache.surfaces",
+    cache,
+    lambda c: c.bytes,
+    limit="max_bytes",
+    trim=SurfaceCache.trim,
+    unit="bytes",
+)
+
+# wid -> hash of the window's icons, dropped when they change
+_icon_hashes = {}
+memory.register("imagecache.icon_hashes", sys.modules[__name__], lambda m: len(m._icon_hashes))
+
+
+def icon_hash(window):
+    try:
+        return _icon_hashes[window.wid]
+    except KeyError:
+        icons = getattr(window, "icons", None) or {}
+        value = hash(tuple(sorted((size, bytes(data)) for size, data in icons.items())))
+        _icon_hashes[window.wid] = value
+        return value
+
+
+@hook.subscribe.net_wm_icon_change
+def _icon_changed(window):
+    _icon_hashes.pop(window.wid, None)
+
+
+@hook.subscribe.client_killed
+def _window_killed(window):
+    _icon_hashes.pop(window.wid, None)
+    cache.discard(lambda key: key[0] == "window" and key[1] == window.wid)
+
+
+def scaled_pattern(surface, size):
+    """Paint ``surface`` once at ``size`` pixels high, return (pattern, bytes)."""
+    height = surface.get_height()
+    width = max(round(surface.get_width() * size / height), 1)
+    scaled = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, width, size)
+    ctx = cairocffi.Context(scaled)
+    ctx.scale(size / height, size / height)
+    ctx.set_source_surface(surface)
+    ctx.get_source().set_filter(cairocffi.FILTER_BEST)
+    ctx.paint()
+    return cairocffi.SurfacePattern(scaled), _surface_bytes(scaled)
+
+
+class CachedImage(Image):
+    """``widget.Image`` decoding its file through the shared cache."""
+
+    def _update_image(self):
+        self.img = None
+        if not self.filename:
+            logger.warning("Image filename not set!")
+            return
+        self.filename = os.path.expanduser(self.filename)
+
+        width = height = None
+        if self.scale and self.bar.horizontal:
+            height = self.bar.height - (self.margin_y * 2)
+        elif self.scale:
+            width = self.bar.width - (self.margin_x * 2)
+        self.img = cache.image(self.filename, width=width, height=height, theta=self.rotate)
+
+    @expose_command()
+    def info(self):
+        d = Image.info(self)
+        d["image_cache"] = cache.info()
+        return d
+
+
+class CachedTaskList(TaskList):
+    """``widget.TaskList`` sharing scaled window icons with the other bars."""
+
+    def get_window_icon(self, window):
+        if not getattr(window, "icons", False) and self.theme_mode is None:
+            return None
+
+        def build():
+            img = None
+            if self.qtile.core.name == "x11":
+                img = self._get_class_icon(window)
+            if self.theme_mode == "preferred" or (self.theme_mode == "fallback" and img is None):
+                img = self._get_theme_icon(window) or img
+            if img is None:
+                return None, 0
+            return scaled_pattern(img, self.icon_size)
+
+        key = ("window", window.wid, icon_hash(window), self.icon_size, self.theme_mode)
+        return cache.get(key, build)
+
+    @expose_command()
+    def info(self):
+        d = TaskList.info(self)
+        d["image_cache"] = cache.info()
+        return d
+
+
+class CachedLaunchBar(LaunchBar):
+    """``widget.LaunchBar`` with its icons decoded at size through the shared cache."""
+
+    def setup_images(self):
+        self._icon_size = self.icon_size if self.icon_size is not None else self.widget_height - 4
+        self._icon_padding = (self.widget_height - self._icon_size) // 2
+
+        icons = {}
+        for name, iconfile in self.icons_files.items():
+            if iconfile is not None and not self.text_only:
+                img = cache.image(iconfile, height=self._icon_size)
+                if img is not None:
+                    icons[name] = img
+        # LaunchBar itself handles the text entries and the icons not found
+        icons_files = self.icons_files
+        self.icons_files = {n: f for n, f in icons_files.items() if n not in icons}
+        try:
+            LaunchBar.setup_images(self)
+        finally:
+            self.icons_files = icons_files
+
+        for name, img in icons.items():
+            pattern = cairocffi.SurfacePattern(img.surface)
+            scaler = cairocffi.Matrix()
+            scaler.translate(self.padding * -1, -2)
+            pattern.set_matrix(scaler)
+            self.surfaces[name] = pattern
+            self.icons_widths[name] = img.width
+
+    @expose_command()
+    def info(self):
+        d = LaunchBar.info(self)
+        d["image_cache"] = cache.info()
+        return d
+
+
+class CachedCurrentLayoutIcon(CurrentLayoutIcon):
+    """``widget.CurrentLayoutIcon`` sharing the layout icons between bars."""
+
+    def _setup_images(self):
+        width = (self.bar.width - 2) * self.scale if not self.bar.horizontal else None
+        height = (self.bar.height - 2) * self.scale if self.bar.horizontal else None
+
+        for names in self._get_layout_names():
+            layout_name = names[0]
+            for layout in dict.fromkeys(names):
+                icon_file_path = self.find_icon_file_path(layout)
+                if icon_file_path:
+                    break
+            else:
+                logger.warning('No icon found for layout "%s"', layout_name)
+                icon_file_path = self.find_icon_file_path("unknown")
+
+            img = cache.image(icon_file_path, width=width, height=height)
+            if img is None:
+                continue
+            if img.width > self.img_length:
+                self.img_length = img.width
+            self.surfaces[layout_name] = img
+
+        self.icons_loaded = True
+
+    @expose_command()
+    def info(self):
+        d = CurrentLayoutIcon.info(self)
+        d["image_cache"] = cache.info()
+        return d
@@ -0,0 +1,450 @@
+"""Incremental config reload.
+
+``lazy.reload_config()`` finalizes every bar, widget, key and group and builds
+them again, even for a one colour change. ``reload_config`` below executes
+the edited config.py on the side, compares what it defines with what is
+running, and only applies the differences:
+
+- keys: only added, removed or changed bindings are ungrabbed/grabbed;
+- widgets: changed drawing options (colours, fonts, paddings, formats...) are
+  set on the live widget, which keeps its state, and the bar is redrawn;
+- plain settings (``follow_mouse_focus``...) are set on ``qtile.config``.
+
+Other names of config.py (``colors``, ``autostart_apps``...) are only applied
+through the keys, bars and settings that use them: a reload where nothing
+else changed is a full one, otherwise they are logged. Anything else (a
+widget added or moved, changed groups, layouts, mouse bindings or hook
+functions, an edited helper module...) falls back to the usual full reload.
+
+Objects are compared by a signature built from their constructor arguments
+(``Configurable._user_config`` or the attributes set by ``__init__``), which
+config.py records at the end of every load with ``snapshot(globals())``.
+Functions are compared by code, defaults and closure values; a closure over
+an object without a signature counts as a change.
+
+The edited config.py is executed for real, so the modules it calls must not
+act on import: they start from hooks, which the trial load does not keep.
+"""
+
+import importlib.util
+import os
+import re
+import sys
+import time
+import types
+
+from libqtile import hook
+from libqtile.config import Screen, _Match
+from libqtile.confreader import Config
+from libqtile.configurable import Configurable
+from libqtile.lazy import LazyCall
+from libqtile.log_utils import logger
+from libqtile.utils import send_notification
+from libqtile.widget.base import _TextBox, _Widget
+
+from modules import autostart, dispatch
+
+# consumed by qtile when it sets itself up: a change needs a full reload
+FULL_RELOAD = {
+    "groups",
+    "layouts",
+    "floating_layout",
+    "mouse",
+    "widget_defaults",
+    "extension_defaults",
+    "dgroups_key_binder",
+    "dgroups_app_rules",
+    "reconfigure_screens",
+    "wmname",
+    "wl_input_rules",
+}
+
+# read from qtile.config whenever they are needed
+SETTINGS = {
+    "follow_mouse_focus",
+    "bring_front_click",
+    "floats_kept_above",
+    "cursor_warp",
+    "auto_fullscreen",
+    "auto_minimize",
+    "focus_on_window_activation",
+    "focus_mouse_dwell_ms",
+    "focus_mouse_min_distance",
+}
+
+# widget options read at draw time: setting the attribute is enough
+WIDGET_OPTIONS = {
+    "background",
+    "foreground",
+    "font",
+    "fontsize",
+    "fontshadow",
+    "padding",
+    "padding_x",
+    "padding_y",
+    "margin",
+    "margin_x",
+    "margin_y",
+    "border",
+    "borders",
+    "border_width",
+    "borderwidth",
+    "linewidth",
+    "highlight_method",
+    "highlight_color",
+    "active",
+    "inactive",
+    "block_highlight_text_color",
+    "this_current_screen_border",
+    "this_screen_border",
+    "other_current_screen_border",
+    "other_screen_border",
+    "urgent_border",
+    "max_title_width",
+    "format",
+    "fmt",
+    "paused_text",
+    "running_text",
+}
+
+# what an incremental reload applies; any other setting qtile reads needs a full one
+APPLIED = SETTINGS | {"keys", "screens"}
+
+GAPS = ("top", "bottom", "left", "right")
+
+MISSING = object()
+
+_snapshot = None
+_loaded_at = time.time()
+_signing = set()  # ids of the functions whose signature is being built
+
+
+def signature(obj):
+    """A hashable value equal for two objects built with the same arguments."""
+    if obj is None or isinstance(obj, (bool, int, float, str, bytes)):
+        return obj
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        items = tuple(signature(i) for i in obj)
+        return tuple(sorted(items, key=repr)) if isinstance(obj, (set, frozenset)) else items
+    if isinstance(obj, dict):
+        return tuple(sorted((k, signature(v)) for k, v in obj.items()))
+    if isinstance(obj, re.Pattern):
+        return ("re", obj.pattern, obj.flags)
+    if isinstance(obj, types.CodeType):
+        return ("code", obj.co_code, signature(obj.co_consts), obj.co_names)
+    if isinstance(obj, types.FunctionType):
+        if id(obj) in _signing:
+            # a closure or default that refers back to the function
+            return ("func", obj.__qualname__)
+        _signing.add(id(obj))
+        try:
+            cells = []
+            for cell in obj.__closure__ or ():
+                try:
+                    cells.append(signature(cell.cell_contents))
+                except ValueError:
+                    cells.append(MISSING)  # a cell not filled yet
+            # not __module__: the candidate config is loaded under another name
+            return (
+                "func",
+                obj.__qualname__,
+                signature(obj.__code__),
+                signature(obj.__defaults__),
+                signature(obj.__kwdefaults__),
+                tuple(cells),
+            )
+        finally:
+            _signing.discard(id(obj))
+    if isinstance(obj, (types.BuiltinFunctionType, types.MethodType, type, types.ModuleType)):
+        return ("ref", getattr(obj, "__module__", None), getattr(obj, "__qualname__", repr(obj)))
+    if isinstance(obj, LazyCall):
+        return (
+            "lazy",
+            signature(obj.selectors),
+            obj.name,
+            signature(obj.args),
+            signature(obj.kwargs),
+            signature(obj._layouts),
+            obj._when_floating,
+            obj._condition,
+            signature(obj._func),
+            signature(obj._focused),
+            obj._if_no_focused,
+        )
+    if isinstance(obj, autostart.App):
+        return (
+            "app",
+            obj.name,
+            signature(obj.cmd),
+            obj.shell,
+            obj.after,
+            signature(obj.ready),
+            obj.priority,
+            obj.heavy,
+            signature(obj.wm_classes),
+            obj.timeout,
+        )
+    if isinstance(obj, _Widget):
+        config = signature(obj._user_config)
+        return (type(obj).__qualname__, config, obj.length_type, obj._length)
+    if isinstance(obj, Configurable):
+        # bars and layouts; bars also carry their widgets and floating its rules
+        extra = {
+            name: value
+            for name, value in vars(obj).items()
+            if name in ("widgets", "_initial_size", "float_rules", "no_reposition_rules")
+        }
+        return (type(obj).__qualname__, signature(obj._user_config), signature(extra))
+    if isinstance(obj, _Match) and hasattr(obj, "_rules"):
+        return ("match", signature(obj._rules))
+    if isinstance(obj, _Match) and hasattr(obj, "matches"):
+        return (type(obj).__qualname__, signature(obj.matches))
+    if isinstance(obj, Screen):
+        return (
+            "screen",
+            tuple(signature(getattr(obj, gap)) for gap in GAPS),
+            signature(obj.wallpaper),
+            signature(obj.wallpaper_mode),
+            signature(obj.x11_drag_polling_rate),
+        )
+    if type(obj).__module__ == "libqtile.config":
+        # Key, KeyChord, Group, Drag, Click... keep what __init__ stored
+        attrs = dict(vars(obj))
+        if "_dispatch" in attrs:
+            # the commands of a running Key are resolved for the current layout
+            attrs["commands"] = attrs.pop("_dispatch")["declared"]
+        return (type(obj).__qualname__, signature(attrs))
+    # anything else is only equal to itself
+    return ("opaque", id(obj))
+
+
+def snapshot(namespace):
+    """Record the signature of every public name of a freshly loaded config."""
+    global _snapshot
+    names = {
+        name: value
+        for name, value in namespace.items()
+        if not name.startswith("_") and not isinstance(value, types.ModuleType)
+    }
+    # widgets change their length once configured: remember what config.py asked
+    for screen in names.get("screens", []):
+        for gap in GAPS:
+            for widget in getattr(getattr(screen, gap), "widgets", []):
+                widget._config_length = (widget.length_type, widget._length)
+    _snapshot = (names, {name: signature(value) for name, value in names.items()})
+
+
+def _load_candidate(path):
+    """Execute config.py without touching the running config or hooks."""
+    spec = importlib.util.spec_from_file_location("_incremental_config", path)
+    module = importlib.util.module_from_spec(spec)
+    saved = {
+        registry: {event: list(funcs) for event, funcs in events.items()}
+        for registry, events in hook.subscriptions.items()
+    }
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        hook.subscriptions.clear()
+        hook.subscriptions.update(saved)
+    return module
+
+
+def _helpers_changed(config_path):
+    """True if a module imported from the config folder changed since the last full load."""
+    folder = os.path.dirname(config_path) + os.sep
+    for module in list(sys.modules.values()):
+        path = getattr(module, "__file__", None)
+        if path and path.startswith(folder) and path != config_path:
+            try:
+                if os.stat(path).st_mtime > _loaded_at:
+                    return True
+            except OSError:
+                return True
+    return False
+
+
+def _key_spec(key):
+    return (tuple(sorted(key.modifiers)), key.key)
+
+
+def _by_spec(keys):
+    return {_key_spec(k): k for k in keys}
+
+
+def _plan_keys(old, new):
+    old_keys, new_keys = _by_spec(old), _by_spec(new)
+    ungrab = [
+        key
+        for spec, key in old_keys.items()
+        if spec not in new_keys or signature(new_keys[spec]) != signature(key)
+    ]
+    grab = [
+        key
+        for spec, key in new_keys.items()
+        if spec not in old_keys or signature(old_keys[spec]) != signature(key)
+    ]
+    return ungrab, grab
+
+
+def _plan_widgets(qtile, new_screens):
+    """Return [(live widget, new widget, changed options)] or None if not possible."""
+    live_screens = qtile.config.screens
+    if len(live_screens) != len(new_screens):
+        return None
+    plan = []
+    for live, new in zip(live_screens, new_screens):
+        if signature(live) == signature(new):
+            continue
+        for gap in GAPS:
+            live_bar, new_bar = getattr(live, gap), getattr(new, gap)
+            if signature(live_bar) == signature(new_bar):
+                continue
+            if live_bar is None or new_bar is None or type(live_bar) is not type(new_bar):
+                return None
+            if signature(live_bar._user_config) != signature(new_bar._user_config):
+                return None
+            if len(live_bar.widgets) != len(new_bar.widgets):
+                return None
+            for live_widget, new_widget in zip(live_bar.widgets, new_bar.widgets):
+                if type(live_widget) is not type(new_widget):
+                    return None
+                if getattr(live_widget, "_config_length", None) != new_widget._config_length:
+                    return None
+                old_config, new_config = live_widget._user_config, new_widget._user_config
+                changed = {
+                    k: v
+                    for k, v in new_config.items()
+                    if signature(v) != signature(old_config.get(k, MISSING))
+                }
+                if old_config.keys() - new_config.keys():
+                    # an option went back to its default: we don't know it here
+                    return None
+                if not changed:
+                    continue
+                if not (changed.keys() <= WIDGET_OPTIONS or hasattr(live_widget, "reconfigure")):
+                    return None
+                plan.append((live_widget, new_widget, changed))
+        screen_options = ("wallpaper", "wallpaper_mode", "x11_drag_polling_rate")
+        if signature([getattr(live, a) for a in screen_options]) != signature(
+            [getattr(new, a) for a in screen_options]
+        ):
+            return None
+    return plan
+
+
+def _apply_widget(widget, new_widget, changed):
+    widget._user_config = dict(new_widget._user_config)
+    if hasattr(widget, "reconfigure"):
+        widget.reconfigure(changed)
+    else:
+        for name, value in changed.items():
+            setattr(widget, name, value)
+        if isinstance(widget, _TextBox) and widget.layout is not None:
+            widget.layout.colour = widget.foreground
+            widget.layout.font_family = widget.font
+            widget.layout.font_size = widget.fontsize
+            widget.layout.font_shadow = widget.fontshadow
+            widget.layout.text = widget.formatted_text
+
+
+def reload_config(qtile):
+    """Apply the changes made to config.py, falling back to a full reload.
+
+    Meant to be bound with ``lazy.function(incremental.reload_config)``.
+    """
+    global _snapshot
+    path = qtile.config.file_path
+
+    def full(reason):
+        logger.info("incremental reload: %s, doing a full reload", reason)
+        qtile.reload_config()
+
+    if _snapshot is None:
+        return full("no snapshot of the running config")
+    if _helpers_changed(path):
+        return full("a helper module changed")
+
+    old_objects, old_sigs = _snapshot
+    try:
+        _load_candidate(path)
+    except Exception as error:
+        _snapshot = (old_objects, old_sigs)
+        logger.exception("Configuration error:")
+        send_notification("Configuration error", str(error))
+        return
+    new_objects, new_sigs = _snapshot
+
+    changed = {
+        name
+        for name in old_sigs.keys() | new_sigs.keys()
+        if old_sigs.get(name, MISSING) != new_sigs.get(name, MISSING)
+    }
+    if not changed:
+        logger.info("incremental reload: nothing changed")
+        return
+
+    functions = {
+        name
+        for name in changed
+        if isinstance(new_objects.get(name, old_objects.get(name)), types.FunctionType)
+    }
+    if functions:
+        return full(f"functions changed: {', '.join(sorted(functions))}")
+    if changed & FULL_RELOAD:
+        return full(f"changed: {', '.join(sorted(changed & FULL_RELOAD))}")
+    unhandled = (changed & Config.__annotations__.keys()) - APPLIED
+    if unhandled:
+        return full(f"changed: {', '.join(sorted(unhandled))}")
+    # config.py's own names (colours, autostart_apps...) only count through what uses them
+    helpers = changed - Config.__annotations__.keys()
+    if not changed & APPLIED:
+        return full(f"changed: {', '.join(sorted(helpers))}, not used by keys, bars or settings")
+
+    widgets = []
+    if "screens" in changed:
+        widgets = _plan_widgets(qtile, new_objects["screens"])
+        if widgets is None:
+            return full("bar layout changed")
+
+    ungrab, grab = [], []
+    if "keys" in changed:
+        if qtile.chord_stack:
+            return full("a key chord is active")
+        ungrab, grab = _plan_keys(qtile.config.keys, new_objects["keys"])
+
+    # everything checked: apply
+    for key in ungrab:
+        qtile.ungrab_key(key)
+    for key in grab:
+        qtile.grab_key(key)
+    if "keys" in changed:
+        qtile.config.keys = new_objects["keys"]
+        # unchanged bindings stay grabbed: dispatch them from the new Key objects too
+        new_keys = _by_spec(new_objects["keys"])
+        for syms, key in list(qtile.keys_map.items()):
+            qtile.keys_map[syms] = new_keys.get(_key_spec(key), key)
+        dispatch.apply(qtile, force=True)
+
+    bars = set()
+    for widget, new_widget, options in widgets:
+        _apply_widget(widget, new_widget, options)
+        bars.add(widget.bar)
+    for bar in bars:
+        bar.draw()
+
+    for name in changed & SETTINGS:
+        setattr(qtile.config, name, new_objects[name])
+
+    # the live widgets now carry the new options, so the new snapshot holds
+    logger.info(
+        "incremental reload: %d keys regrabbed, %d widgets reconfigured, settings: %s",
+        len(grab) + len(ungrab),
+        len(widgets),
+        ", ".join(sorted(changed & SETTINGS)) or "none",
+    )
+    if helpers:
+        logger.warning(
+            "incremental reload: %s changed too, applied only through keys, bars and settings",
+            ", ".join(sorted(helpers)),
+        )
@@ -0,0 +1,235 @@
+"""Latency histograms of key bindings, commands and hooks.
+
+Opt-in, like ``profiling``: set ``QTILE_INSTRUMENT`` in the environment or
+create ``~/.cache/qtile/instrument``. Then every
+
+- key binding (``binding;mod4-shift-h``), from ``process_key_event`` to the
+  end of its commands, ``.when()`` checks included;
+- ``.when()`` check (``check;layout.grow``);
+- command, from a binding, a mouse binding or ``qtile cmd-obj``
+  (``command;group[1].toscreen``);
+- hook subscriber (``hook;startup_once;autostart_session``)
+
+keeps its last ``RING_SIZE`` durations in a ring buffer. Every event loop
+callback is timed as well, and the ones that take more than ``STALL_MS``
+(``QTILE_STALL_MS``) are logged with the callback and kept in ``stalls``.
+
+Histograms, percentiles and stalls (``eval`` only returns the value of an
+expression, hence ``__import__`` rather than an import statement)::
+
+    qtile cmd-obj -o root -f eval -a "__import__('modules.instrument').instrument.report()"
+"""
+
+import asyncio
+import bisect
+import collections
+import functools
+import os
+import time
+
+from libqtile import hook
+from libqtile.log_utils import logger
+from libqtile.utils import get_cache_dir
+
+FLAG = os.path.join(get_cache_dir(), "instrument")
+RING_SIZE = 512
+STALL_MS = float(os.environ.get("QTILE_STALL_MS", 50))
+# upper bounds of the histogram buckets, in milliseconds
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+# a config reload runs this module again in the same namespace: keep what was recorded
+if "rings" not in globals():
+    rings = collections.defaultdict(lambda: collections.deque(maxlen=RING_SIZE))
+    counts = collections.Counter()
+    stalls = collections.deque(maxlen=64)
+
+
+def enabled():
+    return bool(os.environ.get("QTILE_INSTRUMENT")) or os.path.exists(FLAG)
+
+
+def record(name, seconds):
+    rings[name].append(seconds * 1000)
+    counts[name] += 1
+
+
+def _percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def summary(samples):
+    ordered = sorted(samples)
+    histogram = [0] * (len(BUCKETS) + 1)
+    for ms in ordered:
+        histogram[bisect.bisect_left(BUCKETS, ms)] += 1
+    labels = [f"<={b}ms" for b in BUCKETS] + [f">{BUCKETS[-1]}ms"]
+    return dict(
+        p50_ms=round(_percentile(ordered, 50), 3),
+        p99_ms=round(_percentile(ordered, 99), 3),
+        max_ms=round(ordered[-1], 3),
+        histogram={label: n for label, n in zip(labels, histogram) if n},
+    )
+
+
+def report(prefix=""):
+    """``{name: {count, p50_ms, p99_ms, max_ms, histogram}}`` and the last stalls."""
+    timings = {
+        name: dict(count=counts[name], **summary(ring))
+        for name, ring in sorted(rings.items())
+        if ring and name.startswith(prefix)
+    }
+    return dict(timings=timings, stalls=list(stalls), stall_ms=STALL_MS)
+
+
+def reset():
+    rings.clear()
+    counts.clear()
+    stalls.clear()
+
+
+def _command_name(selectors, name):
+    path = "".join(
+        f".{node}" if selector is None else f".{node}[{selector}]"
+        for node, selector in selectors
+    )
+    return f"{path[1:]}.{name}" if path else name
+
+
+def _key_name(key):
+    return "-".join([*key.modifiers, key.key])
+
+
+def _callback_name(func):
+    while isinstance(func, functools.partial):
+        func = func.func
+    return getattr(func, "__qualname__", None) or repr(func)
+
+
+class TimedHook:
+    """A hook subscriber that books its run time; compares equal to the function."""
+
+    # the class is defined again on reload: wrapped subscribers are told by this mark
+    __instrumented__ = True
+
+    def __init__(self, event, func):
+        self.func = func
+        self.name = f"hook;{event};{_callback_name(func)}"
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.func(*args, **kwargs)
+        finally:
+            record(self.name, time.perf_counter() - start)
+
+    def __eq__(self, other):
+        return self.func == getattr(other, "func", other)
+
+    def __hash__(self):
+        return hash(self.func)
+
+
+def _wrap_subscriber(event, func):
+    if getattr(func, "__instrumented__", False) or asyncio.iscoroutinefunction(func):
+        return func
+    if asyncio.iscoroutine(func):
+        return func
+    return TimedHook(event, func)
+
+
+def _patch(owner, name, wrap):
+    """Replace ``owner.name`` by ``wrap(original)``, unless it is already ours.
+
+    The mark is on the function itself: a config reload runs this module again
+    and must not wrap the wrapper.
+    """
+    original = getattr(owner, name)
+    if getattr(original, "__instrumented__", False):
+        return
+    patched = wrap(original)
+    patched.__instrumented__ = True
+    setattr(owner, name, patched)
+
+
+def _timed_process_key_event(process_key_event):
+    def timed_process_key_event(self, keysym, mask):
+        start = time.perf_counter()
+        key, handled = process_key_event(self, keysym, mask)
+        if key is not None:
+            record(f"binding;{_key_name(key)}", time.perf_counter() - start)
+        return key, handled
+
+    return timed_process_key_event
+
+
+def _timed_call(call):
+    def timed_call(self, data):
+        start = time.perf_counter()
+        try:
+            return call(self, data)
+        finally:
+            record(f"command;{_command_name(data[0], data[1])}", time.perf_counter() - start)
+
+    return timed_call
+
+
+def _timed_check(check):
+    def timed_check(self, q):
+        start = time.perf_counter()
+        try:
+            return check(self, q)
+        finally:
+            name = _command_name(self.selectors, self.name)
+            record(f"check;{name}", time.perf_counter() - start)
+
+    return timed_check
+
+
+def _timed_subscribe(subscribe):
+    def timed_subscribe(self, event, func):
+        subscribe(self, event, _wrap_subscriber(event, func))
+        return func
+
+    return timed_subscribe
+
+
+def _timed_run(run):
+    def timed_run(self):
+        start = time.perf_counter()
+        run(self)
+        ms = (time.perf_counter() - start) * 1000
+        if ms >= STALL_MS:
+            callback = _callback_name(self._callback)
+            stalls.append(dict(at=time.time(), ms=round(ms, 1), callback=callback))
+            logger.warning("event loop stalled for %.1f ms in %s", ms, callback)
+
+    return timed_run
+
+
+def installed():
+    return getattr(asyncio.Handle._run, "__instrumented__", False)
+
+
+def install():
+    """Wrap key handling, commands, hooks and loop callbacks. Idempotent, reloads included."""
+    from libqtile.command.interface import IPCCommandServer
+    from libqtile.core.manager import Qtile
+    from libqtile.lazy import LazyCall
+
+    if installed():
+        return
+
+    _patch(Qtile, "process_key_event", _timed_process_key_event)
+    _patch(IPCCommandServer, "call", _timed_call)
+    _patch(LazyCall, "check", _timed_check)
+    # hooks subscribed from now on (config reloads included), then the ones already there
+    _patch(hook.Subscribe, "_subscribe", _timed_subscribe)
+    for registry in hook.subscriptions.values():
+        for event, subscribers in registry.items():
+            subscribers[:] = [_wrap_subscriber(event, func) for func in subscribers]
+    _patch(asyncio.Handle, "_run", _timed_run)
+    logger.info("instrumentation on, stalls over %s ms are logged", STALL_MS)
+
+
+if enabled():
+    install()
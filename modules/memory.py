@@ -0,0 +1,313 @@
+"""Memory diagnostics for sessions that stay up for weeks.
+
+Three tools, all run on demand from ``qtile cmd-obj``:
+
+- ``snapshot(label)`` takes a ``tracemalloc`` snapshot, together with a count
+  of the live widgets, layouts and windows by class and the process RSS.
+  ``diff(old, new)`` compares two of them. Allocations are charged to the
+  innermost qtile or config frame of their traceback, e.g. ``widget;tasklist``,
+  ``layout;columns``, ``window`` or ``config;rules``. Tracing is costly, so it is
+  opt-in like ``instrument``: set ``QTILE_TRACEMALLOC`` (the number of frames
+  kept, 25 if not a number) or create ``~/.cache/qtile/tracemalloc``. A first
+  ``snapshot`` starts it too, but it then only sees what is allocated after;
+- ``windows()`` counts the live ``Window`` objects (after a garbage
+  collection), the ones qtile manages and the top-level windows the X server
+  has. Objects that are no longer in ``windows_map`` are leaks, and so are
+  managed windows the server does not know any more;
+- ``caches()`` lists the size of every cache registered with ``register``
+  and its limit, which ``set_limit`` changes at runtime.
+
+Windows and caches need no tracing. ``eval`` only returns the value of an
+expression, hence ``__import__`` rather than an import statement::
+
+    qtile cmd-obj -o root -f eval -a "__import__('modules.memory').memory.snapshot('login')"
+    qtile cmd-obj -o root -f eval -a "__import__('modules.memory').memory.diff('login')"
+    qtile cmd-obj -o root -f eval -a "__import__('modules.memory').memory.windows()"
+    qtile cmd-obj -o root -f eval -a "__import__('modules.memory').memory.caches()"
+"""
+
+import collections
+import gc
+import os
+import time
+import tracemalloc
+import weakref
+
+from libqtile.log_utils import logger
+from libqtile.utils import get_cache_dir
+
+FLAG = os.path.join(get_cache_dir(), "tracemalloc")
+FRAMES = 25
+# each snapshot holds every traced allocation: keep few of them
+SNAPSHOTS = 4
+TOP = 25
+CONFIG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# a config reload runs this module again: keep the snapshots and the caches registered
+if "snapshots" not in globals():
+    snapshots = collections.OrderedDict()  # label -> dict(snapshot, census, rss, at)
+    _registry = []
+
+
+def enabled():
+    return bool(os.environ.get("QTILE_TRACEMALLOC")) or os.path.exists(FLAG)
+
+
+def start(frames=None):
+    if frames is None:
+        setting = os.environ.get("QTILE_TRACEMALLOC", "")
+        frames = int(setting) if setting.isdigit() else FRAMES
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        logger.info("memory: tracing allocations, %s frames", frames)
+
+
+def rss():
+    """Resident set size in bytes."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _categories():
+    from libqtile.backend.base.window import _Window
+    from libqtile.layout.base import Layout
+    from libqtile.widget.base import _Widget
+
+    return (("widget", _Widget), ("layout", Layout), ("window", _Window))
+
+
+def census():
+    """``{"widget;TaskList": count, ...}`` of the live objects, after a collection."""
+    gc.collect()
+    categories = _categories()
+    counts = collections.Counter()
+    for obj in gc.get_objects():
+        for category, cls in categories:
+            if isinstance(obj, cls):
+                counts[f"{category};{type(obj).__name__}"] += 1
+                break
+    return dict(sorted(counts.items()))
+
+
+def _owner(filename):
+    """The group an allocation made in ``filename`` is charged to, if any."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    path = filename.replace(os.sep, "/")
+    if "/libqtile/widget/" in path:
+        return f"widget;{stem}"
+    if "/libqtile/layout/" in path:
+        return f"layout;{stem}"
+    if "/libqtile/backend/" in path:
+        return "window" if stem == "window" else f"backend;{stem}"
+    if "/libqtile/" in path:
+        return f"qtile;{stem}"
+    if filename.startswith(CONFIG_DIR):
+        return f"config;{stem}"
+    return None
+
+
+def _group(traceback):
+    # frames go from the oldest to the most recent: charge the innermost known one
+    for frame in reversed(traceback):
+        owner = _owner(frame.filename)
+        if owner is not None:
+            return owner
+    return f"other;{os.path.basename(traceback[-1].filename)}"
+
+
+def snapshot(label=None):
+    """Take a snapshot under ``label`` (``s1``, ``s2``... by default), return its summary."""
+    start()
+    if label is None:
+        label = f"s{len(snapshots) + 1}"
+        while label in snapshots:
+            label += "'"
+    taken = tracemalloc.take_snapshot().filter_traces(
+        (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        )
+    )
+    snapshots.pop(label, None)
+    snapshots[label] = dict(snapshot=taken, census=census(), rss=rss(), at=time.time())
+    while len(snapshots) > SNAPSHOTS:
+        snapshots.popitem(last=False)
+    traced, peak = tracemalloc.get_traced_memory()
+    return dict(
+        label=label,
+        rss_mb=round(snapshots[label]["rss"] / 2**20, 1),
+        traced_mb=round(traced / 2**20, 1),
+        peak_mb=round(peak / 2**20, 1),
+        kept=list(snapshots),
+    )
+
+
+def diff(old=None, new=None, top=TOP):
+    """Growth from snapshot ``old`` to ``new``, by owner and by object count.
+
+    ``new`` defaults to a snapshot taken now, ``old`` to the newest one before it.
+    """
+    if new is None:
+        new = snapshot()["label"]
+    labels = list(snapshots)
+    if new not in snapshots:
+        raise KeyError(f"no snapshot {new!r}, kept: {labels}")
+    if old is None:
+        position = labels.index(new)
+        if position == 0:
+            raise KeyError(f"no snapshot before {new!r}")
+        old = labels[position - 1]
+    before, after = snapshots[old], snapshots[new]
+
+    groups = collections.defaultdict(lambda: [0, 0])
+    for stat in after["snapshot"].compare_to(before["snapshot"], "traceback"):
+        group = groups[_group(stat.traceback)]
+        group[0] += stat.size_diff
+        group[1] += stat.count_diff
+    ranked = sorted(groups.items(), key=lambda item: -abs(item[1][0]))[:top]
+
+    objects = {}
+    for name in sorted(before["census"].keys() | after["census"].keys()):
+        change = after["census"].get(name, 0) - before["census"].get(name, 0)
+        if change:
+            objects[name] = change
+
+    return dict(
+        old=old,
+        new=new,
+        seconds=round(after["at"] - before["at"]),
+        rss_kb=(after["rss"] - before["rss"]) // 1024,
+        allocations={name: dict(kb=size // 1024, blocks=count) for name, (size, count) in ranked},
+        objects=objects,
+    )
+
+
+def windows():
+    """Live ``Window`` objects against the managed windows and the X server's."""
+    from libqtile import qtile
+    from libqtile.backend.base.window import _Window
+
+    gc.collect()
+    live = [obj for obj in gc.get_objects() if isinstance(obj, _Window)]
+    managed = qtile.windows_map
+    result = dict(
+        live=dict(collections.Counter(type(w).__name__ for w in live)),
+        managed=len(managed),
+        unmanaged_objects=[
+            dict(wid=w.wid, cls=type(w).__name__, name=getattr(w, "name", None))
+            for w in live
+            if managed.get(w.wid) is not w
+        ],
+    )
+    if qtile.core.name == "x11":
+        tree = set(qtile.core._root.query_tree())
+        result["x_windows"] = len(tree)
+        result["gone_from_server"] = sorted(wid for wid in managed if wid not in tree)
+    return result
+
+
+class _Entry:
+    def __init__(self, name, owner, size, limit, trim, unit):
+        self.name = name
+        try:
+            self.owner = weakref.ref(owner)
+        except TypeError:
+            self.owner = lambda: owner
+        self.size = size
+        self.limit = limit
+        self.trim = trim
+        self.unit = unit
+
+    def get_limit(self, owner):
+        if callable(self.limit):
+            return self.limit(owner)
+        if self.limit is not None:
+            return getattr(owner, self.limit)
+        return None
+
+
+def register(name, owner, size, limit=None, trim=None, unit="entries"):
+    """Report ``size(owner)`` under ``name`` for as long as ``owner`` lives.
+
+    ``limit`` is the attribute of ``owner`` holding its bound, which
+    ``set_limit`` changes before calling ``trim(owner)``, or a function of
+    ``owner`` for a bound that cannot change. Module level caches pass their
+    module as ``owner``.
+    """
+
+    def replaced(entry):
+        current = entry.owner()
+        # dead, or a module executed again that registers its caches again
+        return current is None or (entry.name == name and current is owner)
+
+    _registry[:] = [e for e in _registry if not replaced(e)]
+    _registry.append(_Entry(name, owner, size, limit, trim, unit))
+
+
+def _entries():
+    """``(name, entry, owner)`` of the live entries; a name used twice gets ``#n``."""
+    alive = [(e, e.owner()) for e in _registry]
+    _registry[:] = [e for e, owner in alive if owner is not None]
+    totals = collections.Counter(e.name for e, owner in alive if owner is not None)
+    seen = collections.Counter()
+    for entry, owner in alive:
+        if owner is None:
+            continue
+        seen[entry.name] += 1
+        name = entry.name if totals[entry.name] == 1 else f"{entry.name}#{seen[entry.name]}"
+        yield name, entry, owner
+
+
+def caches():
+    """``{name: {size, limit, unit}}`` of the registered caches."""
+    report = {}
+    for name, entry, owner in _entries():
+        try:
+            size = entry.size(owner)
+        except Exception as error:
+            size = f"error: {error}"
+        report[name] = dict(size=size, limit=entry.get_limit(owner), unit=entry.unit)
+    return report
+
+
+def set_limit(name, limit):
+    """Bound the cache ``name``, or every ``name#n``, to ``limit`` and trim it."""
+    changed = []
+    for full_name, entry, owner in list(_entries()):
+        if name not in (full_name, entry.name):
+            continue
+        if not isinstance(entry.limit, str):
+            raise ValueError(f"the limit of {full_name} cannot be changed")
+        setattr(owner, entry.limit, limit)
+        if entry.trim is not None:
+            entry.trim(owner)
+        changed.append(full_name)
+    if not changed:
+        raise KeyError(f"no cache {name!r}")
+    logger.info("memory: limit of %s set to %s", ", ".join(changed), limit)
+    return caches()
+
+
+def trim_lru(entries, limit, evicted=None):
+    """Drop the oldest items of the ``OrderedDict`` ``entries`` down to ``limit``."""
+    while len(entries) > max(limit, 0):
+        _, value = entries.popitem(last=False)
+        if evicted is not None:
+            evicted(value)
+
+
+def report():
+    tracing = tracemalloc.is_tracing()
+    traced = tracemalloc.get_traced_memory()[0] if tracing else None
+    return dict(
+        rss_mb=round(rss() / 2**20, 1),
+        tracing=tracing,
+        traced_mb=None if traced is None else round(traced / 2**20, 1),
+        snapshots=list(snapshots),
+        caches=caches(),
+    )
+
+
+if enabled():
+    start()
@@ -0,0 +1,140 @@
+"""Focus follows the mouse, once the mouse settles.
+
+With ``follow_mouse_focus = True`` every window the pointer crosses gets the
+focus: borders are repainted, the task lists of the three bars redrawn and
+the focus hooks fired, for each window on the way to the far screen.
+
+Here an enter only marks the window as a candidate. The pointer is then
+polled and the candidate gets the focus once the pointer:
+
+- stayed still for ``focus_mouse_dwell_ms``, or
+- moved ``focus_mouse_min_distance`` pixels or more into it, which is a
+  deliberate move rather than a sweep across it.
+
+Entering another window replaces the candidate; leaving for something that
+is not a window (a bar, the root) drops it. Both count as skipped focus
+changes. Config::
+
+    follow_mouse_focus = False  # the stock, immediate one
+    focus_mouse_dwell_ms = 80
+    focus_mouse_min_distance = 40
+
+Setting ``focus_mouse_dwell_ms = None`` turns it off. Counters::
+
+    qtile cmd-obj -o root -f eval -a "__import__('modules.mousefocus').mousefocus.follower.stats"
+"""
+
+import math
+import time
+
+from libqtile import hook
+from libqtile.log_utils import logger
+
+# how often the pointer is checked while a candidate is pending
+POLL_INTERVAL = 0.015
+
+
+class FocusFollower:
+    def __init__(self):
+        self.qtile = None
+        self.candidate = None
+        self.entered_at = None
+        self.last_position = None
+        self.still_since = 0.0
+        self.timer = None
+        self.stats = dict(enters=0, focused=0, skipped=0, left=0, already_focused=0)
+
+    def enter(self, client):
+        qtile = client.qtile
+        dwell = getattr(qtile.config, "focus_mouse_dwell_ms", None)
+        if dwell is None:
+            return
+        self.qtile = qtile
+        self.stats["enters"] += 1
+        if self.candidate is not None and self.candidate is not client:
+            self.stats["skipped"] += 1
+        self.cancel()
+        if dwell <= 0:
+            self._focus(client)
+            return
+        self.candidate = client
+        position = qtile.core.get_mouse_position()
+        self.entered_at = self.last_position = position
+        self.still_since = time.monotonic()
+        self.timer = qtile.call_later(POLL_INTERVAL, self._poll)
+
+    def cancel(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.candidate = None
+
+    @staticmethod
+    def _contains(client, x, y):
+        border = client.borderwidth
+        return (
+            client.x <= x < client.x + client.width + 2 * border
+            and client.y <= y < client.y + client.height + 2 * border
+        )
+
+    def _poll(self):
+        self.timer = None
+        client = self.candidate
+        qtile = self.qtile
+        if client is None:
+            return
+        if client.group is None or client.wid not in qtile.windows_map:
+            self.candidate = None
+            return
+        try:
+            x, y = qtile.core.get_mouse_position()
+        except Exception:
+            logger.exception("mousefocus: unable to query the pointer")
+            self.candidate = None
+            return
+        if not self._contains(client, x, y):
+            # left for a bar or the root window, no enter will tell us
+            self.stats["left"] += 1
+            self.stats["skipped"] += 1
+            self.candidate = None
+            return
+
+        now = time.monotonic()
+        if (x, y) != self.last_position:
+            self.last_position = (x, y)
+            self.still_since = now
+        dwell = (getattr(qtile.config, "focus_mouse_dwell_ms", None) or 0) / 1000
+        distance = getattr(qtile.config, "focus_mouse_min_distance", None)
+        travelled = math.hypot(x - self.entered_at[0], y - self.entered_at[1])
+        if now - self.still_since >= dwell or (distance and travelled >= distance):
+            self.candidate = None
+            self._focus(client)
+        else:
+            self.timer = qtile.call_later(POLL_INTERVAL, self._poll)
+
+    def _focus(self, client):
+        # what the stock follow_mouse_focus does on enter
+        qtile = client.qtile
+        group = client.group
+        if group.current_window is client and qtile.current_screen is group.screen:
+            self.stats["already_focused"] += 1
+            return
+        self.stats["focused"] += 1
+        if group.current_window is not client:
+            group.focus(client, False)
+        if group.screen and qtile.current_screen != group.screen:
+            qtile.focus_screen(group.screen.index, False)
+
+
+follower = FocusFollower()
+
+
+@hook.subscribe.client_mouse_enter
+def _client_mouse_enter(client):
+    follower.enter(client)
+
+
+@hook.subscribe.client_killed
+def _client_killed(client):
+    if follower.candidate is client:
+        follower.cancel()
@@ -0,0 +1,80 @@
+"""Timing of config load and bar setup.
+
+config.py calls ``mark(name)`` after each of its sections; the time since the
+previous mark is booked under ``config;<name>``. Bars book each widget's
+``_configure`` under ``bars;<screen>;<widget>`` through ``timed``. Once the
+startup hook has fired, the timings are written in the folded stack format
+(``a;b;c <microseconds>`` per line) that flamegraph.pl, speedscope and
+inferno read directly.
+
+Timings are collected until the startup hook (a few perf_counter calls), so
+the incremental reload's trial load of config.py adds none; the file is only
+written when ``QTILE_PROFILE_CONFIG`` is set in the environment or when
+``~/.cache/qtile/profile-config`` exists.
+"""
+
+import contextlib
+import os
+import time
+
+from libqtile import hook
+from libqtile.log_utils import logger
+from libqtile.utils import get_cache_dir
+
+FLAG = os.path.join(get_cache_dir(), "profile-config")
+OUTPUT = os.path.join(get_cache_dir(), "config-profile.folded")
+
+# imported first thing by config.py, which makes this our t0
+_last = time.perf_counter()
+samples = []
+# set once the profile of this load is out: later timings belong to no load
+_done = False
+
+
+def enabled():
+    return bool(os.environ.get("QTILE_PROFILE_CONFIG")) or os.path.exists(FLAG)
+
+
+def record(stack, seconds):
+    if not _done:
+        samples.append((stack, seconds))
+
+
+def mark(name):
+    """Book the time since the previous mark under ``config;<name>``."""
+    global _last
+    now = time.perf_counter()
+    record(f"config;{name}", now - _last)
+    _last = now
+
+
+@contextlib.contextmanager
+def timed(stack):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stack, time.perf_counter() - start)
+
+
+def write(path=OUTPUT):
+    totals = {}
+    for stack, seconds in samples:
+        totals[stack] = totals.get(stack, 0) + seconds
+    try:
+        with open(path, "w") as f:
+            for stack, seconds in totals.items():
+                f.write(f"{stack} {round(seconds * 1e6)}\n")
+    except OSError:
+        logger.exception("unable to write %s", path)
+        return
+    total = sum(totals.values())
+    logger.info("config profile (%.1f ms total) written to %s", total * 1000, path)
+
+
+@hook.subscribe.startup
+def _write_profile():
+    global _done
+    _done = True
+    if enabled():
+        write()
@@ -0,0 +1,97 @@
+"""A bar that coalesces redraw requests into frames.
+
+Widgets call ``draw()`` on their own timers and every call normally paints
+straight away. ``CoalescingBar`` turns each of those calls into a damage mark:
+dirty widgets are collected while the event loop is busy and repainted together,
+at most ``max_fps`` times per second. Only the dirty widgets are repainted,
+unless something asked for a full bar redraw (e.g. a widget changed width).
+"""
+
+import functools
+import time
+
+from libqtile import bar
+from libqtile.command.base import expose_command
+
+from modules import profiling
+
+
+class CoalescingBar(bar.Bar):
+    """``bar.Bar`` with per-widget damage tracking and a frame rate cap."""
+
+    defaults = [
+        ("max_fps", 30, "Maximum number of repaints per second."),
+    ]
+
+    def __init__(self, widgets, size, **config):
+        bar.Bar.__init__(self, widgets, size, **config)
+        self.add_defaults(CoalescingBar.defaults)
+        self._dirty = set()
+        self._full_redraw = False
+        self._painting = False
+        self._last_frame = 0.0
+        self.stats = dict(requested=0, performed=0, frames=0, full_redraws=0)
+
+    def _configure_widget(self, widget):
+        with profiling.timed(f"bars;screen{self.screen.index};{widget.name}"):
+            configured = bar.Bar._configure_widget(self, widget)
+        # _configure runs again when screens change: only wrap once
+        if configured and not hasattr(widget, "_paint"):
+            widget._paint = widget.draw
+            widget.draw = functools.partial(self._request_widget, widget)
+        return configured
+
+    def _request_widget(self, widget):
+        if self._painting:
+            # we are inside a frame, e.g. a full redraw calling every widget
+            widget._paint()
+            self.stats["performed"] += 1
+            return
+        self.stats["requested"] += 1
+        self._dirty.add(widget)
+        self._schedule_frame()
+
+    def draw(self):
+        if not self.widgets:
+            return
+        # a full redraw asks for every widget to be repainted
+        self.stats["requested"] += len(self.widgets)
+        self._full_redraw = True
+        self._schedule_frame()
+
+    def _schedule_frame(self):
+        if self.future is not None:
+            return
+        delay = self._last_frame + 1 / self.max_fps - time.monotonic()
+        if delay > 0:
+            self.future = self.qtile.call_later(delay, self._frame)
+        else:
+            # still let everything queued in this loop iteration mark itself dirty
+            self.future = self.qtile.call_soon(self._frame)
+
+    def _frame(self):
+        self.future = None
+        self._last_frame = time.monotonic()
+        self.stats["frames"] += 1
+        dirty, self._dirty = self._dirty, set()
+        self._painting = True
+        try:
+            if self._full_redraw:
+                self._full_redraw = False
+                self.stats["full_redraws"] += 1
+                self._actual_draw()
+            else:
+                for widget in self.widgets:
+                    if widget in dirty and widget.configured:
+                        widget._paint()
+                        self.stats["performed"] += 1
+        finally:
+            self._painting = False
+
+    @expose_command()
+    def redraw_stats(self):
+        """Redraws requested by widgets versus repaints actually done."""
+        stats = dict(self.stats)
+        stats["coalesced"] = stats["requested"] - stats["performed"]
+        stats["max_fps"] = self.max_fps
+        return stats
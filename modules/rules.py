@@ -0,0 +1,135 @@
+"""Compiled window rules for group routing and floating.
+
+``compile_rules`` turns a list of ``Match`` objects into one ``CompiledMatch``
+that gives the same answer as ``any(m.compare(c) for m in matches)``:
+
+- single property rules with a literal value go into a hash index;
+- single property rules with a regex are merged, per property, into one
+  alternation so a window is tested with one ``re.match`` per property;
+- everything else (``func`` rules, rules on several properties) is kept as is
+  and compared the usual way.
+
+The indexed part only depends on the window properties, so its result is
+memoized per ``(wm_class, role, title, wm_type)``. A property change gives a
+new key, which is how stale entries get out of the way; the memo is a bounded
+LRU so titles that change all the time cannot make it grow.
+"""
+
+import re
+from collections import OrderedDict
+
+from libqtile.config import Match, _Match
+
+from modules import memory
+
+# properties the index understands, in the order used for the memo key
+INDEXED = ("wm_class", "wm_instance_class", "role", "title", "wm_type")
+
+
+def _properties(client):
+    wm_class = client.get_wm_class() or []
+    return {
+        "wm_class": tuple(wm_class),
+        "wm_instance_class": wm_class[0] if wm_class else None,
+        "role": client.get_wm_role(),
+        "title": client.name,
+        "wm_type": client.get_wm_type(),
+    }
+
+
+class CompiledMatch(_Match):
+    """Answers "does any of these rules match?" with hash lookups and one regex per property."""
+
+    def __init__(self, matches, memo_size=1024):
+        self.matches = list(matches)
+        self.memo_size = memo_size
+        self.memo = OrderedDict()
+        self.literals = {}
+        self.patterns = {}
+        self.fallback = []
+        self.stats = dict(hits=0, misses=0, fallback=0)
+        self.registered = False
+
+        regexes = {}
+        for match in self.matches:
+            rules = getattr(match, "_rules", None)
+            if not isinstance(match, Match) or not rules or len(rules) != 1:
+                self.fallback.append(match)
+                continue
+            (name, value), = rules.items()
+            if name not in INDEXED:
+                self.fallback.append(match)
+            elif isinstance(value, str):
+                self.literals.setdefault(name, set()).add(value)
+            elif isinstance(value, re.Pattern):
+                regexes.setdefault((name, value.flags), []).append(value.pattern)
+            else:
+                self.fallback.append(match)
+
+        for (name, flags), patterns in regexes.items():
+            combined = re.compile("|".join(f"(?:{p})" for p in patterns), flags)
+            self.patterns.setdefault(name, []).append(combined)
+
+    def _indexed(self, props):
+        for name in INDEXED:
+            value = props[name]
+            if value is None:
+                continue
+            # wm_class matches if any of its strings does, like Match does
+            values = value if name == "wm_class" else (value,)
+            literals = self.literals.get(name)
+            if literals and any(v in literals for v in values):
+                return True
+            for pattern in self.patterns.get(name, ()):
+                if any(pattern.match(v) for v in values):
+                    return True
+        return False
+
+    def _register(self):
+        # on first use: rules only built by a trial load of config.py are never reported
+        self.registered = True
+        memory.register(
+            "rules.memo",
+            self,
+            lambda m: len(m.memo),
+            limit="memo_size",
+            trim=lambda m: memory.trim_lru(m.memo, m.memo_size),
+        )
+
+    def compare(self, client):
+        if not self.registered:
+            self._register()
+        props = _properties(client)
+        key = tuple(props[name] for name in INDEXED)
+        try:
+            result = self.memo[key]
+            self.memo.move_to_end(key)
+            self.stats["hits"] += 1
+        except KeyError:
+            result = self._indexed(props)
+            self.memo[key] = result
+            memory.trim_lru(self.memo, self.memo_size)
+            self.stats["misses"] += 1
+        if result:
+            return True
+        if self.fallback:
+            self.stats["fallback"] += 1
+            return any(m.compare(client) for m in self.fallback)
+        return False
+
+    def info(self):
+        return dict(
+            self.stats,
+            memo=len(self.memo),
+            literals=sum(len(v) for v in self.literals.values()),
+            patterns=sum(len(v) for v in self.patterns.values()),
+            fallback_rules=len(self.fallback),
+        )
+
+    def __repr__(self):
+        return f"<CompiledMatch {self.matches!r}>"
+
+
+def compile_rules(matches, memo_size=1024):
+    """Compile a list of ``Match`` into a single ``CompiledMatch``."""
+    return CompiledMatch(matches, memo_size=memo_size)
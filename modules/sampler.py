@@ -0,0 +1,396 @@
+"""One /proc and /sys sampler feeding the Net, Wlan, Memory and Battery texts.
+
+The stock widgets each open and parse their own files on their own timer.
+Here a single ``Sampler`` keeps one file descriptor per source open for the
+whole session and re-reads it with ``preadv`` into a preallocated buffer
+(procfs and sysfs regenerate their content on a read at offset 0), once per
+tick, and pushes the parsed values to the subscribed widgets. Only sources
+with subscribers are read.
+
+The tick slows down while the screen is locked (see ``lock_screen``) and while
+running on battery.
+"""
+
+import glob
+import math
+import os
+import time
+
+from libqtile.command.base import expose_command
+from libqtile.log_utils import logger
+from libqtile.pangocffi import markup_escape_text
+from libqtile.utils import create_task
+from libqtile.widget import base
+
+from modules import spawner
+
+NET_DEV = "/proc/net/dev"
+MEMINFO = "/proc/meminfo"
+WIRELESS = "/proc/net/wireless"
+POWER_SUPPLY = "/sys/class/power_supply"
+
+
+class Source:
+    """A pseudo-file kept open and re-read in place."""
+
+    def __init__(self, path, size=4096):
+        self.path = path
+        self.fd = None
+        self.buf = bytearray(size)
+        self.reads = 0
+
+    def read(self):
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_RDONLY | os.O_CLOEXEC)
+        n = os.preadv(self.fd, [self.buf], 0)
+        self.reads += 1
+        if n == len(self.buf):
+            # content outgrew the buffer: grow once and read again
+            self.buf = bytearray(len(self.buf) * 2)
+            return self.read()
+        return self.buf[:n].decode()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def parse_net_dev(text):
+    interfaces = {}
+    for line in text.splitlines()[2:]:
+        name, _, fields = line.partition(":")
+        fields = fields.split()
+        interfaces[name.strip()] = (int(fields[0]), int(fields[8]))
+    return interfaces
+
+
+def parse_meminfo(text):
+    values = {}
+    for line in text.splitlines():
+        key, _, value = line.partition(":")
+        values[key] = int(value.split()[0])
+    used = values["MemTotal"] - values.get("MemAvailable", values["MemFree"])
+    values["MemPercent"] = round(used / values["MemTotal"] * 100, 1)
+    return values
+
+
+def parse_wireless(text):
+    quality = {}
+    for line in text.splitlines()[2:]:
+        name, _, fields = line.partition(":")
+        quality[name.strip()] = int(float(fields.split()[1]))
+    return quality
+
+
+def parse_uevent(text):
+    values = {}
+    for line in text.splitlines():
+        key, _, value = line.partition("=")
+        values[key.removeprefix("POWER_SUPPLY_")] = value
+    return values
+
+
+class Sampler:
+    """Reads every subscribed source once per tick and fans the values out."""
+
+    def __init__(self, interval=2, battery_factor=2, locked_factor=15):
+        self.interval = interval
+        self.battery_factor = battery_factor
+        self.locked_factor = locked_factor
+        self.locked = False
+        self.on_battery = False
+        self.subscribers = {}
+        self.sources = {}
+        self.handle = None
+        self.ticks = 0
+        self._essid = {}
+
+    def _source(self, name):
+        if name not in self.sources:
+            if name == "net":
+                self.sources[name] = [Source(NET_DEV)]
+            elif name == "memory":
+                self.sources[name] = [Source(MEMINFO)]
+            elif name == "wlan":
+                self.sources[name] = [Source(WIRELESS)]
+            elif name == "battery":
+                self.sources[name] = [
+                    Source(os.path.join(path, "uevent"))
+                    for path in sorted(glob.glob(os.path.join(POWER_SUPPLY, "*")))
+                ]
+        return self.sources[name]
+
+    @property
+    def current_interval(self):
+        interval = self.interval
+        if self.locked:
+            interval *= self.locked_factor
+        elif self.on_battery:
+            interval *= self.battery_factor
+        return interval
+
+    def subscribe(self, name, callback, qtile):
+        self.subscribers.setdefault(name, set()).add(callback)
+        self._schedule(qtile, 0)
+
+    def unsubscribe(self, name, callback):
+        self.subscribers.get(name, set()).discard(callback)
+        if not any(self.subscribers.values()):
+            if self.handle is not None:
+                self.handle.cancel()
+                self.handle = None
+            for sources in self.sources.values():
+                for source in sources:
+                    source.close()
+
+    def set_locked(self, qtile, locked):
+        self.locked = locked
+        if not locked and any(self.subscribers.values()):
+            # catch up right away instead of waiting out the slow tick
+            self._schedule(qtile, 0)
+
+    def _schedule(self, qtile, delay=None):
+        if self.handle is not None:
+            self.handle.cancel()
+        if delay is None:
+            delay = self.current_interval
+        self.handle = qtile.call_later(delay, self._tick, qtile)
+
+    def _read(self, name):
+        if name == "net":
+            interfaces = parse_net_dev(self.sources[name][0].read())
+            return {"time": time.monotonic(), "interfaces": interfaces}
+        if name == "memory":
+            return parse_meminfo(self.sources[name][0].read())
+        if name == "wlan":
+            quality = parse_wireless(self.sources[name][0].read())
+            for iface in quality.keys() - self._essid.keys():
+                # the ESSID is not in /proc: only ask for it when a link comes up
+                self._essid[iface] = self._get_essid(iface)
+            for iface in self._essid.keys() - quality.keys():
+                del self._essid[iface]
+            return {iface: (self._essid[iface], q) for iface, q in quality.items()}
+        if name == "battery":
+            supplies = [parse_uevent(source.read()) for source in self.sources[name]]
+            batteries = [s for s in supplies if s.get("TYPE") == "Battery"]
+            mains = [s for s in supplies if s.get("TYPE") == "Mains"]
+            self.on_battery = bool(mains) and not any(s.get("ONLINE") == "1" for s in mains)
+            return {"batteries": batteries, "on_battery": self.on_battery}
+
+    def _get_essid(self, iface):
+        # imported here: only needed when a wireless link comes up
+        try:
+            import iwlib
+        except ImportError:
+            return ""
+        try:
+            return bytes(iwlib.get_iwconfig(iface).get("ESSID", b"")).decode()
+        except Exception:
+            return ""
+
+    def _tick(self, qtile):
+        self.handle = None
+        self.ticks += 1
+        for name, callbacks in self.subscribers.items():
+            if not callbacks:
+                continue
+            try:
+                self._source(name)
+                values = self._read(name)
+            except (OSError, ValueError, IndexError, KeyError):
+                logger.exception("sampler: unable to read %s", name)
+                continue
+            for callback in list(callbacks):
+                try:
+                    callback(values)
+                except Exception:
+                    logger.exception("sampler: a %s subscriber failed to update", name)
+        if any(self.subscribers.values()):
+            self._schedule(qtile)
+
+    def info(self):
+        return dict(
+            ticks=self.ticks,
+            interval=self.current_interval,
+            locked=self.locked,
+            on_battery=self.on_battery,
+            reads={
+                source.path: source.reads
+                for sources in self.sources.values()
+                for source in sources
+            },
+        )
+
+
+sampler = Sampler()
+
+
+def lock_screen(qtile, command="xsecurelock"):
+    """Run the screen locker and slow the sampler down until it exits.
+
+    Meant to be bound with ``lazy.function(sampler.lock_screen)``.
+    """
+    instance = sampler
+
+    async def run():
+        instance.set_locked(qtile, True)
+        try:
+            # through the spawn helper when it runs, see modules/spawner.py
+            pid = await spawner.spawn_async(qtile, [command])
+            if pid != -1:
+                await spawner.wait_exit(pid)
+        except OSError:
+            logger.exception("unable to run %s", command)
+        finally:
+            instance.set_locked(qtile, False)
+
+    create_task(run())
+
+
+class SampledText(base._TextBox):
+    """Base class for texts fed by the shared sampler."""
+
+    source = None
+
+    defaults = [("format", "{}", "Display format.")]
+
+    def __init__(self, **config):
+        base._TextBox.__init__(self, "", **config)
+        self.add_defaults(SampledText.defaults)
+
+    def timer_setup(self):
+        # keep our own reference: a config reload rebinds the module global
+        self._sampler = sampler
+        self._sampler.subscribe(self.source, self.receive, self.qtile)
+
+    def finalize(self):
+        if hasattr(self, "_sampler"):
+            self._sampler.unsubscribe(self.source, self.receive)
+        base._TextBox.finalize(self)
+
+    def receive(self, values):
+        self.update(self.render(values))
+
+    def render(self, values):
+        raise NotImplementedError
+
+    @expose_command()
+    def info(self):
+        d = base._TextBox.info(self)
+        d["sampler"] = self._sampler.info()
+        return d
+
+
+class NetText(SampledText):
+    """Down and up speed of one interface, same fields as ``widget.Net``."""
+
+    source = "net"
+
+    defaults = [
+        ("interface", "wlan0", "Interface to monitor."),
+        ("format", "{down:.0f}{down_suffix} ↓↑ {up:.0f}{up_suffix}", "Display format."),
+    ]
+
+    units = ["B", "kB", "MB", "GB", "TB"]
+
+    def __init__(self, **config):
+        SampledText.__init__(self, **config)
+        self.add_defaults(NetText.defaults)
+        self.last = None
+
+    def convert_b(self, num_bytes):
+        # counters reset when the interface goes down and up again
+        num_bytes = max(num_bytes, 0)
+        power = min(int(math.log(num_bytes, 1000)), len(self.units) - 1) if num_bytes >= 1 else 0
+        return num_bytes / 1000**power, self.units[power]
+
+    def render(self, values):
+        counters = values["interfaces"].get(self.interface)
+        if counters is None:
+            return f"{self.interface} down"
+        last, self.last = self.last, (values["time"], counters)
+        if last is None or values["time"] <= last[0]:
+            return self.text
+        elapsed = values["time"] - last[0]
+        down, down_suffix = self.convert_b((counters[0] - last[1][0]) / elapsed)
+        up, up_suffix = self.convert_b((counters[1] - last[1][1]) / elapsed)
+        return self.format.format(
+            interface=self.interface,
+            down=down,
+            down_suffix=down_suffix,
+            up=up,
+            up_suffix=up_suffix,
+        )
+
+
+class MemoryText(SampledText):
+    """Any /proc/meminfo field (in MiB) plus ``MemPercent``."""
+
+    source = "memory"
+
+    defaults = [("format", "Mem{MemPercent}%", "Display format.")]
+
+    def __init__(self, **config):
+        SampledText.__init__(self, **config)
+        self.add_defaults(MemoryText.defaults)
+
+    def render(self, values):
+        fields = {k: v // 1024 for k, v in values.items()}
+        fields["MemPercent"] = values["MemPercent"]
+        return self.format.format(**fields)
+
+
+class WlanText(SampledText):
+    """ESSID and link quality, same fields as ``widget.Wlan``."""
+
+    source = "wlan"
+
+    defaults = [
+        ("interface", "wlan0", "Wireless interface to monitor."),
+        ("format", "{essid} {quality}/70", "Display format."),
+        ("disconnected_message", "Disconnected", "Text shown when not connected."),
+    ]
+
+    def __init__(self, **config):
+        SampledText.__init__(self, **config)
+        self.add_defaults(WlanText.defaults)
+
+    def render(self, values):
+        if self.interface not in values:
+            return self.disconnected_message
+        essid, quality = values[self.interface]
+        return self.format.format(
+            essid=markup_escape_text(essid), quality=quality, percent=quality / 70
+        )
+
+
+class BatteryText(SampledText):
+    """Charge of the first battery, same ``char``/``percent`` as ``widget.Battery``."""
+
+    source = "battery"
+
+    defaults = [
+        ("format", "{char}{percent:2.0%}", "Display format."),
+        ("charge_char", "^", "Character shown while charging."),
+        ("discharge_char", "V", "Character shown while discharging."),
+        ("full_char", "=", "Character shown when full."),
+        ("not_charging_char", "*", "Character shown when plugged but not charging."),
+        ("unknown_char", "?", "Character shown when the status is unknown."),
+    ]
+
+    def __init__(self, **config):
+        SampledText.__init__(self, **config)
+        self.add_defaults(BatteryText.defaults)
+
+    def render(self, values):
+        if not values["batteries"]:
+            return "No battery"
+        battery = values["batteries"][0]
+        char = {
+            "Charging": self.charge_char,
+            "Discharging": self.discharge_char,
+            "Full": self.full_char,
+            "Not charging": self.not_charging_char,
+        }.get(battery.get("STATUS"), self.unknown_char)
+        return self.format.format(char=char, percent=int(battery.get("CAPACITY", 0)) / 100)
@@ -0,0 +1,55 @@
+"""The spawn helper process, see ``spawner``.
+
+Run as ``python -S spawnd.py <fd>`` with ``<fd>`` a SOCK_SEQPACKET socket.
+Each request is a JSON object ``{"args": [...], "env": {...}}``; ``env`` is
+only sent when it changed and is kept for the next requests. The reply is
+``{"pid": <pid>}`` or ``{"error": "<message>"}``. Only the standard library
+is imported so that the helper stays small.
+"""
+
+import json
+import os
+import signal
+import socket
+import sys
+
+
+def main(fd):
+    sock = socket.socket(fileno=fd)
+    sock.set_inheritable(False)
+    # nobody waits for our children: let the kernel reap them
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    null = os.open(os.devnull, os.O_RDWR)
+    file_actions = [(os.POSIX_SPAWN_DUP2, null, target) for target in (0, 1, 2)]
+    if hasattr(os, "POSIX_SPAWN_CLOSEFROM"):
+        file_actions.append((os.POSIX_SPAWN_CLOSEFROM, 3))
+    env = dict(os.environ)
+
+    while True:
+        try:
+            data = sock.recv(1 << 20)
+        except InterruptedError:
+            continue
+        if not data:
+            # qtile went away
+            return
+        try:
+            request = json.loads(data)
+            env = request.get("env", env)
+            pid = os.posix_spawnp(
+                request["args"][0],
+                request["args"],
+                env,
+                file_actions=file_actions,
+                # SIG_IGN would be inherited through exec
+                setsigdef=(signal.SIGCHLD,),
+                setsigmask=(),
+            )
+            reply = {"pid": pid}
+        except Exception as error:
+            reply = {"error": f"{type(error).__name__}: {error}"}
+        sock.send(json.dumps(reply).encode())
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]))
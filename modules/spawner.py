@@ -0,0 +1,191 @@
+"""Launch programs from a small helper process.
+
+``qtile.spawn`` starts programs from the qtile process itself, which after a
+day holds a few hundred MB. ``SpawnHelper`` starts ``spawnd.py`` (standard
+library only, a few MB) while qtile is still small. Launches are sent to it
+over a socket pair, without blocking the event loop while it answers, and it
+starts them with ``posix_spawnp``, with qtile's current environment and with
+stdio on /dev/null, as qtile does. How much this saves depends on the libc:
+glibc's ``posix_spawn`` already runs the child on qtile's memory
+(``CLONE_VFORK``) rather than on a copy of it. ``bench/bench_spawn.py``
+measures both.
+
+The helper is optional. If it was not started, died or does not answer
+within ``TIMEOUT``, launches fall back to ``qtile.spawn``, and so do
+launches with a ``group``. ``spawn`` returns right away, without the pid;
+``spawn_async`` waits for the helper's answer and returns it. Config::
+
+    spawner.start()  # early in config.py
+    Key([mod], "Return", lazy.function(spawner.spawn, terminal)),
+
+The helper is started by the ``startup`` hook and kept across config
+reloads. ``start`` also shadows ``qtile.spawn`` then, so the LaunchBar goes
+through the helper as well. ``lazy.spawn`` resolves the command on the class
+and keeps the stock path.
+"""
+
+import asyncio
+import functools
+import json
+import os
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+
+from libqtile import hook
+from libqtile.log_utils import logger
+from libqtile.utils import create_task
+
+HELPER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "spawnd.py")
+# the helper answers within a millisecond; past this it is considered stuck
+TIMEOUT = 0.5
+
+
+class SpawnHelper:
+    def __init__(self):
+        self.sock = None
+        self.pid = None
+        self.sent_env = None
+        self.lock = None
+        self.stats = dict(helper=0, fallback=0, failures=0)
+
+    def start(self):
+        if self.sock is not None:
+            return
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        child.set_inheritable(True)
+        try:
+            args = [sys.executable, "-S", HELPER, str(child.fileno())]
+            self.pid = os.posix_spawn(sys.executable, args, os.environ)
+        except OSError:
+            logger.exception("spawner: unable to start the helper, using qtile.spawn")
+            parent.close()
+            return
+        finally:
+            child.close()
+        parent.setblocking(False)
+        self.sock = parent
+        self.sent_env = None
+        logger.info("spawner: helper started, pid %s", self.pid)
+
+    def stop(self):
+        if self.sock is not None:
+            # the helper exits on EOF
+            self.sock.close()
+            self.sock = None
+
+    async def request(self, args, env):
+        """Start ``args`` in the helper, return the pid or None if it cannot."""
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        # one request at a time: replies come back in order on the one socket
+        async with self.lock:
+            sock = self.sock
+            if sock is None:
+                return None
+            loop = asyncio.get_running_loop()
+            message = {"args": args}
+            if env != self.sent_env:
+                message["env"] = env
+            try:
+                await loop.sock_sendall(sock, json.dumps(message).encode())
+                data = await asyncio.wait_for(loop.sock_recv(sock, 4096), TIMEOUT)
+                if not data:
+                    raise ConnectionError("the helper exited")
+                reply = json.loads(data)
+            except (OSError, ValueError, asyncio.TimeoutError) as error:
+                # a late reply would answer the next request: drop the helper
+                logger.warning(
+                    "spawner: helper failed (%r), using qtile.spawn from now on", error
+                )
+                self.stats["failures"] += 1
+                self.stop()
+                return None
+        self.sent_env = env
+        if "error" in reply:
+            logger.warning("spawner: helper could not start %s: %s", args[0], reply["error"])
+            return None
+        return reply["pid"]
+
+
+# a config reload runs this module again: keep the running helper
+if "helper" not in globals():
+    helper = SpawnHelper()
+
+
+def _fallback(qtile, cmd, shell, env, group=None):
+    helper.stats["fallback"] += 1
+    return type(qtile).spawn(qtile, cmd, shell=shell, env=env or dict(), group=group)
+
+
+async def spawn_async(qtile, cmd, shell=False, env=None):
+    """``qtile.spawn`` through the helper, returning the pid once the helper answered."""
+    if helper.sock is None:
+        return _fallback(qtile, cmd, shell, env)
+
+    if isinstance(cmd, str):
+        args = shlex.split(cmd)
+    else:
+        args = list(cmd)
+        cmd = subprocess.list2cmdline(args)
+    if shutil.which(args[0]) is None:
+        logger.error("couldn't find `%s`", args[0])
+        return -1
+    if shell:
+        args = ["/bin/sh", "-c", cmd]
+    if not env:
+        env = dict(os.environ)
+        # as qtile.spawn: don't hand qtile's virtualenv down
+        env.pop("VIRTUAL_ENV", None)
+
+    pid = await helper.request(args, env)
+    if pid is None:
+        return _fallback(qtile, cmd, shell, env)
+    helper.stats["helper"] += 1
+    return pid
+
+
+def spawn(qtile, cmd, shell=False, env=None, group=None):
+    """``qtile.spawn`` through the helper, without waiting for it.
+
+    The pid is only known once the helper answered, so None is returned for a
+    launch sent to it; ``spawn_async`` gives the pid.
+    """
+    if group is not None or helper.sock is None:
+        return _fallback(qtile, cmd, shell, env, group)
+    create_task(spawn_async(qtile, cmd, shell=shell, env=env))
+    return None
+
+
+async def wait_exit(pid):
+    """Wait for ``pid`` to exit, whether it is our child or the helper's."""
+    try:
+        fd = os.pidfd_open(pid)
+    except ProcessLookupError:
+        return
+    loop = asyncio.get_running_loop()
+    exited = loop.create_future()
+    loop.add_reader(fd, exited.set_result, None)
+    try:
+        await exited
+    finally:
+        loop.remove_reader(fd)
+        os.close(fd)
+
+
+def _install():
+    from libqtile import qtile
+
+    # started here rather than when config.py is imported: ``qtile check``, the
+    # benches and the incremental reload's trial load import it too
+    helper.start()
+    # an instance attribute: seen by qtile.spawn() callers, not by lazy.spawn
+    qtile.spawn = functools.partial(spawn, qtile)
+
+
+def start():
+    """Start the helper once qtile runs (kept across config reloads), route qtile.spawn to it."""
+    hook.subscribe.startup(_install)
+    hook.subscribe.shutdown(helper.stop)
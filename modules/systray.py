@@ -0,0 +1,268 @@
+"""Systray that embeds icons in batches and repaints one slot at a time.
+
+At login nm-applet, blueman, copyq, nextcloud, flameshot, keepassxc, teams
+and emacs dock within the same second. ``widget.Systray`` answers every dock
+request, every ``_XEMBED_INFO`` change and every icon that goes away with a
+redraw of the whole bar, and Qt applets set ``_XEMBED_INFO`` again each time
+they change their icon. ``BatchedSystray``:
+
+- collects docks and removals for ``embed_delay`` seconds and lays the tray
+  out once. The bar is only redrawn when the tray's width changed, otherwise
+  the tray alone is repainted;
+- keeps its width at least ``reserved_icons`` icons wide, and keeps the width
+  of icons that went away for ``shrink_delay`` seconds (Teams restarting), so
+  the widgets next to it do not move;
+- handles an ``_XEMBED_INFO`` or size hint change of one icon on its own: an
+  icon already shown is left alone, one that docked unmapped has its room in
+  the layout and is shown by repainting its slot, and a size change goes
+  through the batched layout;
+- only sends a ConfigureWindow to the icons whose slot moved.
+
+``info`` on the widget (``qtile cmd-obj -o widget systray -f info``) counts the
+docks, bar redraws, tray and slot repaints and skipped ConfigureWindows.
+"""
+
+import cairocffi
+import xcffib
+from xcffib.xproto import SetMode
+
+from libqtile.backend.x11 import window
+from libqtile.command.base import expose_command
+from libqtile.widget import systray
+
+REQUEST_DOCK = 0
+
+
+class BatchedIcon(systray.Icon):
+    def __init__(self, win, qtile, tray):
+        systray.Icon.__init__(self, win, qtile, tray)
+        self.embed_mapped = True
+        self.update_embed_info()
+
+    def update_embed_info(self):
+        """Read the ``_XEMBED_INFO`` mapped flag; an icon without the property is shown."""
+        info = self.window.get_property("_XEMBED_INFO", unpack=int)
+        self.embed_mapped = not info or bool(info[1])
+
+    def handle_PropertyNotify(self, e):  # noqa: N802
+        name = self.qtile.core.conn.atoms.get_name(e.atom)
+        if name == "_XEMBED_INFO":
+            self.update_embed_info()
+            if self.embed_mapped:
+                self.systray.icon_mapped(self)
+        elif name == "WM_NORMAL_HINTS":
+            self.systray.icon_resized(self)
+        return False
+
+    def handle_DestroyNotify(self, event):  # noqa: N802
+        icon = self.qtile.windows_map.pop(event.window, None)
+        if icon in self.systray.tray_icons:
+            self.systray.tray_icons.remove(icon)
+            self.systray.stats["removals"] += 1
+        self.systray.schedule_layout()
+        return False
+
+    handle_UnmapNotify = handle_DestroyNotify  # noqa: N815
+
+
+class BatchedSystray(systray.Systray):
+    """``widget.Systray`` with batched docking and per-slot repaints."""
+
+    defaults = [
+        ("embed_delay", 0.15, "Seconds during which docks and removals are collected."),
+        ("reserved_icons", 0, "Icons the tray keeps room for, even when fewer are docked."),
+        ("shrink_delay", 10, "Seconds the tray keeps the room of icons that went away."),
+    ]
+
+    def __init__(self, **config):
+        systray.Systray.__init__(self, **config)
+        self.add_defaults(BatchedSystray.defaults)
+        self._layout_timer = None
+        self._shrink_timer = None
+        self._floor = 0
+        self._drawn_length = None
+        self._slots = {}  # wid -> geometry the icon was last placed at
+        self.stats = dict(
+            docks=0,
+            removals=0,
+            layouts=0,
+            bar_redraws=0,
+            tray_repaints=0,
+            slot_repaints=0,
+            ignored_updates=0,
+            places=0,
+            skipped_places=0,
+        )
+
+    def _icons_length(self):
+        return systray.Systray.calculate_length(self)
+
+    def calculate_length(self):
+        reserved = self.reserved_icons * (self.icon_size + self.padding)
+        return max(self._icons_length(), reserved, self._floor)
+
+    def handle_ClientMessage(self, event):  # noqa: N802
+        atoms = self.conn.atoms
+        data = event.data.data32
+        if event.type != atoms["_NET_SYSTEM_TRAY_OPCODE"] or data[1] != REQUEST_DOCK:
+            return False
+
+        wid = data[2]
+        icon = BatchedIcon(window.XWindow(self.conn, wid), self.qtile, self)
+        if icon not in self.tray_icons:
+            self.tray_icons.append(icon)
+            self.tray_icons.sort(key=lambda icon: icon.name)
+            self.qtile.windows_map[wid] = icon
+        self.conn.conn.core.ChangeSaveSet(SetMode.Insert, wid)
+        self.conn.conn.core.ReparentWindow(wid, self.bar.window.window.wid, 0, 0)
+        self.conn.conn.flush()
+        self.stats["docks"] += 1
+        # an icon not mapped yet gets its room now and is shown in it later
+        self.schedule_layout()
+        return False
+
+    def schedule_layout(self):
+        """Lay the tray out once the docks and removals of the next ``embed_delay`` are in."""
+        if self._layout_timer is None:
+            self._layout_timer = self.qtile.call_later(self.embed_delay, self._layout)
+
+    def _layout(self):
+        self._layout_timer = None
+        self.stats["layouts"] += 1
+        wids = {icon.wid for icon in self.tray_icons}
+        self._slots = {wid: slot for wid, slot in self._slots.items() if wid in wids}
+
+        length = self._icons_length()
+        if length >= self._floor:
+            self._floor = length
+            if self._shrink_timer is not None:
+                self._shrink_timer.cancel()
+                self._shrink_timer = None
+        elif self._shrink_timer is None:
+            self._shrink_timer = self.qtile.call_later(self.shrink_delay, self._shrink)
+
+        if self.calculate_length() != self._drawn_length:
+            self.stats["bar_redraws"] += 1
+            self.bar.draw()
+        else:
+            self.stats["tray_repaints"] += 1
+            self.draw()
+
+    def _shrink(self):
+        self._shrink_timer = None
+        self._floor = self._icons_length()
+        if self.calculate_length() != self._drawn_length:
+            self.stats["bar_redraws"] += 1
+            self.bar.draw()
+
+    def _offsets(self):
+        offset = self.padding
+        for icon in self.tray_icons:
+            yield icon, offset
+            offset += (icon.width if self.bar.horizontal else icon.height) + self.padding
+
+    def _place(self, icon, offset):
+        if self.bar.horizontal:
+            x = self.offsetx + offset
+            y = self.bar.height // 2 - self.icon_size // 2 + self.offsety
+        else:
+            x = self.bar.width // 2 - self.icon_size // 2 + self.offsetx
+            y = self.offsety + offset
+        # the pixmap was just painted again: the icons take their background from it
+        icon.window.set_attribute(backpixmap=self.drawer.pixmap)
+        slot = (x, y, icon.width, self.icon_size)
+        show = icon.hidden and icon.embed_mapped
+        if not show and self._slots.get(icon.wid) == slot:
+            self.stats["skipped_places"] += 1
+            return
+        self.stats["places"] += 1
+        self._slots[icon.wid] = slot
+        icon.place(x, y, icon.width, self.icon_size, 0, None)
+        if show:
+            icon.unhide()
+            data = [
+                self.conn.atoms["_XEMBED_EMBEDDED_NOTIFY"],
+                xcffib.xproto.Time.CurrentTime,
+                0,
+                self.bar.window.wid,
+                systray.XEMBED_PROTOCOL_VERSION,
+            ]
+            u = xcffib.xproto.ClientMessageData.synthetic(data, "I" * 5)
+            event = xcffib.xproto.ClientMessageEvent.synthetic(
+                format=32, window=icon.wid, type=self.conn.atoms["_XEMBED"], data=u
+            )
+            self.window.send_event(event)
+
+    def draw(self):
+        self._drawn_length = self.length
+        self.drawer.clear(self.background or self.bar.background)
+        self.draw_at_default_position()
+        for icon, offset in self._offsets():
+            self._place(icon, offset)
+
+    def icon_mapped(self, icon):
+        """An icon set its ``_XEMBED_INFO`` mapped flag."""
+        if not icon.hidden:
+            # Qt sets it again with every new icon image, which the applet paints itself
+            self.stats["ignored_updates"] += 1
+        elif icon.wid not in self._slots or self._layout_timer is not None:
+            # not laid out yet, or about to be: the layout shows it
+            self.schedule_layout()
+        else:
+            self._repaint_slot(icon)
+
+    def icon_resized(self, icon):
+        size = (icon.width, icon.height)
+        icon.update_size()
+        if (icon.width, icon.height) != size:
+            self.schedule_layout()
+        else:
+            self.stats["ignored_updates"] += 1
+
+    def _repaint_slot(self, icon):
+        """Paint the background of one icon's slot and show the icon."""
+        offsets = {i.wid: offset for i, offset in self._offsets()}
+        if icon.wid not in offsets:
+            self.schedule_layout()
+            return
+        offset = offsets[icon.wid]
+        if self.bar.horizontal:
+            x, y, width, height = offset, 0, icon.width, self.height
+        else:
+            x, y, width, height = 0, offset, self.width, icon.height
+        ctx = self.drawer.ctx
+        ctx.save()
+        # replace the slot's pixels: painting over a translucent background would darken it
+        ctx.set_operator(cairocffi.OPERATOR_SOURCE)
+        ctx.rectangle(x, y, width, height)
+        self.drawer.set_source_rgb(self.background or self.bar.background)
+        ctx.fill()
+        ctx.restore()
+        self.drawer.draw(
+            offsetx=self.offsetx + x,
+            offsety=self.offsety + y,
+            width=width,
+            height=height,
+            src_x=x,
+            src_y=y,
+        )
+        self._place(icon, offset)
+        self.stats["slot_repaints"] += 1
+
+    def finalize(self):
+        for timer in (self._layout_timer, self._shrink_timer):
+            if timer is not None:
+                timer.cancel()
+        self._layout_timer = self._shrink_timer = None
+        systray.Systray.finalize(self)
+
+    @expose_command()
+    def info(self):
+        info = systray.Systray.info(self)
+        info["tray"] = dict(
+            self.stats,
+            icons=len(self.tray_icons),
+            length=self._icons_length(),
+            reserved_length=self.calculate_length(),
+        )
+        return info
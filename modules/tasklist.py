@@ -0,0 +1,250 @@
+"""TaskList that batches title changes.
+
+Teams, Nextcloud or emacs can change ``_NET_WM_NAME`` many times per second.
+``widget.TaskList`` answers every change with a full bar redraw, during which
+each title is measured with a new pango layout, truncated and laid out again,
+on each of the three bars. ``CoalescingTaskList``:
+
+- collects title changes for ``title_delay`` seconds and handles them at once;
+- measures titles through an LRU shared by the bars (same font, same titles)
+  and keeps the truncated layouts of each widget in an LRU keyed on
+  ``(title, font, width)``;
+- when no box changes width, only repaints the boxes whose text changed and
+  copies just that part of the widget to the bar.
+
+Anything else (focus, urgency, a box changing width, the widget moving)
+still goes through a full redraw. ``info`` shows the counters.
+"""
+
+import sys
+from collections import OrderedDict
+
+import cairocffi
+
+from libqtile import hook
+from libqtile.command.base import expose_command
+
+from modules import memory
+from modules.imagecache import CachedTaskList
+
+# (text, font, fontsize, markup) -> width of the text, shared by the bars
+_text_widths = OrderedDict()
+TEXT_WIDTHS_SIZE = 1024
+memory.register(
+    "tasklist.text_widths",
+    sys.modules[__name__],
+    lambda m: len(m._text_widths),
+    limit="TEXT_WIDTHS_SIZE",
+    trim=lambda m: memory.trim_lru(m._text_widths, m.TEXT_WIDTHS_SIZE),
+)
+
+
+class CoalescingTaskList(CachedTaskList):
+    """``TaskList`` batching title changes and caching its text layouts."""
+
+    defaults = [
+        ("title_delay", 0.1, "Seconds during which title changes are collected."),
+        ("layout_cache_size", 128, "Truncated title layouts kept by the widget."),
+    ]
+
+    def __init__(self, **config):
+        CachedTaskList.__init__(self, **config)
+        self.add_defaults(CoalescingTaskList.defaults)
+        self._pending = set()
+        self._flush_timer = None
+        self._layouts = OrderedDict()
+        self._sizer = None
+        self._base_layout = None
+        self._last_boxes = []
+        self._recording = None
+        self._painted = None
+        self.stats = dict(
+            title_events=0,
+            flushes=0,
+            partial_repaints=0,
+            boxes_repainted=0,
+            full_redraws=0,
+            width_hits=0,
+            width_misses=0,
+            layout_hits=0,
+            layout_misses=0,
+        )
+
+    def _configure(self, qtile, bar):
+        CachedTaskList._configure(self, qtile, bar)
+        # here rather than in __init__: widgets built by a trial load of config.py
+        # are never configured
+        memory.register(
+            "tasklist.layouts",
+            self,
+            lambda w: len(w._layouts),
+            limit="layout_cache_size",
+            trim=CoalescingTaskList._trim_layouts,
+        )
+        # drawtext() points self.layout at cached layouts, keep the original to finalize it
+        self._base_layout = self.layout
+        self._sizer = self.drawer.textlayout(
+            "", "ffffff", self.font, self.fontsize, None, markup=self.markup
+        )
+
+    def setup_hooks(self):
+        hook.subscribe.client_name_updated(self._title_changed)
+        hook.subscribe.focus_change(self.update)
+        hook.subscribe.float_change(self.update)
+        hook.subscribe.client_urgent_hint_changed(self.update)
+
+        hook.subscribe.net_wm_icon_change(self.invalidate_cache)
+        hook.subscribe.client_killed(self.remove_icon_cache)
+
+    def finalize(self):
+        for layout in self._layouts.values():
+            layout.finalize()
+        self._layouts.clear()
+        if self._base_layout is not None:
+            self._base_layout.finalize()
+        self.layout = None
+        if self._sizer is not None:
+            self._sizer.finalize()
+            self._sizer = None
+        CachedTaskList.finalize(self)
+
+    def _title_changed(self, window):
+        # cheaper than self.windows, which asks X for every window's state
+        if getattr(window, "group", None) is not self.bar.screen.group:
+            return
+        self.stats["title_events"] += 1
+        self._pending.add(window)
+        if self._flush_timer is None:
+            self._flush_timer = self.timeout_add(self.title_delay, self._flush)
+
+    def _flush(self):
+        self._flush_timer = None
+        pending, self._pending = self._pending, set()
+        if not pending or self.finalized:
+            return
+        self.stats["flushes"] += 1
+        if not self._repaint_titles():
+            self.stats["full_redraws"] += 1
+            self.bar.draw()
+
+    def box_width(self, text):
+        key = (text, self.font, self.fontsize, self.markup)
+        try:
+            width = _text_widths[key]
+            _text_widths.move_to_end(key)
+            self.stats["width_hits"] += 1
+        except KeyError:
+            self.stats["width_misses"] += 1
+            self._sizer.text = text
+            width = self._sizer.width
+            _text_widths[key] = width
+            memory.trim_lru(_text_widths, TEXT_WIDTHS_SIZE)
+        return width + 2 * (self.padding_side + self.borderwidth)
+
+    def drawtext(self, text, textcolor, width):
+        key = (text, self.font, self.fontsize, self.fontshadow, width)
+        try:
+            layout = self._layouts[key]
+            self._layouts.move_to_end(key)
+            self.stats["layout_hits"] += 1
+        except KeyError:
+            self.stats["layout_misses"] += 1
+            layout = self.drawer.textlayout(
+                text,
+                textcolor,
+                self.font,
+                self.fontsize,
+                self.fontshadow,
+                wrap=False,
+                markup=self.markup,
+            )
+            if width is not None:
+                layout.width = width
+            self._layouts[key] = layout
+            self._trim_layouts()
+        layout.colour = textcolor
+        # drawbox() draws whatever self.layout is
+        self.layout = layout
+
+    def _trim_layouts(self):
+        memory.trim_lru(self._layouts, self.layout_cache_size, lambda layout: layout.finalize())
+
+    def calc_box_widths(self):
+        self._last_boxes = list(CachedTaskList.calc_box_widths(self))
+        return self._last_boxes
+
+    def drawbox(self, offset, text, bordercolor, textcolor, **kwargs):
+        if self._recording is not None:
+            self._recording.append([offset, text, bordercolor, textcolor, kwargs])
+        CachedTaskList.drawbox(self, offset, text, bordercolor, textcolor, **kwargs)
+
+    def draw(self):
+        self._recording = []
+        try:
+            CachedTaskList.draw(self)
+        finally:
+            boxes, self._recording = self._recording, None
+        self._painted = dict(
+            geometry=(self.offsetx, self.offsety, self.width),
+            windows=[box[0] for box in self._last_boxes],
+            widths=[box[3] for box in self._last_boxes],
+            boxes=boxes,
+            ends=list(self._box_end_positions),
+        )
+
+    def _repaint_titles(self):
+        """Repaint the boxes whose title changed, False if a full redraw is needed."""
+        painted = self._painted
+        background = self.background or self.bar.background
+        if painted is None or not self.bar.horizontal:
+            return False
+        if (self.offsetx, self.offsety, self.width) != painted["geometry"]:
+            return False
+        if getattr(self.bar, "_full_redraw", False) or self in getattr(self.bar, "_dirty", ()):
+            # a repaint of the widget is already on its way
+            return True
+
+        boxes = list(self.calc_box_widths())
+        if [box[0] for box in boxes] != painted["windows"]:
+            return False
+        if [box[3] for box in boxes] != painted["widths"]:
+            return False
+        changed = [i for i, box in enumerate(boxes) if box[2] != painted["boxes"][i][1]]
+        if not changed:
+            return True
+
+        start = painted["boxes"][changed[0]][0]
+        end = painted["ends"][changed[-1]]
+        for i in changed:
+            offset, _, bordercolor, textcolor, kwargs = painted["boxes"][i]
+            # replace the pixels, as drawer.clear does: a translucent background
+            # painted over the old box would not hide it
+            ctx = self.drawer.ctx
+            ctx.save()
+            ctx.set_operator(cairocffi.OPERATOR_SOURCE)
+            ctx.rectangle(offset, 0, painted["ends"][i] - offset, self.height)
+            self.drawer.set_source_rgb(background)
+            ctx.fill()
+            ctx.restore()
+            painted["boxes"][i][1] = boxes[i][2]
+            CachedTaskList.drawbox(self, offset, boxes[i][2], bordercolor, textcolor, **kwargs)
+        self.drawer.draw(
+            offsetx=self.offsetx + start,
+            offsety=self.offsety,
+            width=end - start,
+            height=self.height,
+            src_x=start,
+        )
+        self.stats["partial_repaints"] += 1
+        self.stats["boxes_repainted"] += len(changed)
+        return True
+
+    @expose_command()
+    def info(self):
+        d = CachedTaskList.info(self)
+        d.update(
+            self.stats,
+            cached_layouts=len(self._layouts),
+            cached_widths=len(_text_widths),
+        )
+        return d
@@ -0,0 +1,50 @@
+"""``guess_terminal`` with an on-disk cache.
+
+``libqtile.utils.guess_terminal`` probes every PATH directory for a list of
+terminals on each config load. The answer only changes when PATH or the
+content of one of its directories changes, so it is cached together with
+PATH and the newest directory mtime, which a ``stat`` per directory checks.
+"""
+
+import json
+import os
+
+from libqtile.utils import get_cache_dir, guess_terminal
+
+CACHE = os.path.join(get_cache_dir(), "terminal.json")
+
+
+def _path_key():
+    path = os.environ.get("PATH", "")
+    mtime = 0.0
+    for directory in path.split(os.pathsep):
+        try:
+            mtime = max(mtime, os.stat(directory).st_mtime)
+        except OSError:
+            continue
+    return path, mtime
+
+
+def cached_guess_terminal(preference=None, cache=CACHE):
+    path, mtime = _path_key()
+    try:
+        with open(cache) as f:
+            cached = json.load(f)
+        if (
+            cached["path"] == path
+            and cached["mtime"] == mtime
+            and cached["preference"] == preference
+        ):
+            return cached["terminal"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    terminal = guess_terminal(preference)
+    try:
+        with open(cache, "w") as f:
+            json.dump(
+                dict(path=path, mtime=mtime, preference=preference, terminal=terminal), f
+            )
+    except OSError:
+        pass
+    return terminal
@@ -0,0 +1,148 @@
+"""MonadTall and Columns that only touch the windows that change.
+
+A layout pass (a window added, ``grow``, ``shuffle``...) calls ``place`` on
+every client of the group, and every ``place`` sends a ConfigureWindow, a
+synthetic ConfigureNotify and repaints the border, even for windows that do
+not move. With a few VirtualBox and Remmina windows that means flicker and a
+lot of X traffic.
+
+The layouts below remember what they last applied to each client and compare
+it with what ``configure`` asks for:
+
+- nothing changed: nothing is sent;
+- only the border changed (focus moved): only the border is repainted;
+- otherwise the window is placed as usual.
+
+The client's current geometry is checked as well, so a window moved by
+something else (floating, another layout) is placed again.
+
+Repainting a border allocates its colour, an X round trip that flushes the
+request buffer, so one pass went out in as many flushes as there were
+windows. Colour pixels are cached on the connection, and the requests of a
+pass now go out in the flush qtile does after handling the event.
+
+``prelayout`` lays a hidden group out ahead of time without mapping its
+windows (see ``groupswitch``), so that showing it only maps them.
+
+``info`` on the layout (``qtile cmd-obj -o layout -f info``) counts the
+places, border repaints and skipped configures.
+"""
+
+import functools
+
+from libqtile import layout
+from libqtile.command.base import expose_command
+
+from modules import memory
+
+
+def cache_color_pixels(core):
+    """Memoize ``color_pixel`` on the X connection, it is a round trip each time."""
+    conn = getattr(core, "conn", None)
+    if core.name != "x11" or conn is None or hasattr(conn, "_uncached_color_pixel"):
+        return
+    conn._uncached_color_pixel = conn.color_pixel
+    conn.color_pixel = functools.lru_cache(maxsize=256)(conn.color_pixel)
+    memory.register(
+        "tiling.color_pixels",
+        conn,
+        lambda c: c.color_pixel.cache_info().currsize,
+        limit=lambda c: c.color_pixel.cache_info().maxsize,
+    )
+
+
+def _margins(margin):
+    if margin is None:
+        return [0] * 4
+    if isinstance(margin, int):
+        return [margin] * 4
+    return margin
+
+
+class GeometryDiffMixin:
+    def _reset_diff(self):
+        self._applied = {}
+        self.diff_stats = dict(places=0, borders=0, skipped=0, prelayouts=0)
+
+    def clone(self, group):
+        c = super().clone(group)
+        # clone() is a shallow copy: don't share what another group applied
+        c._reset_diff()
+        cache_color_pixels(group.qtile.core)
+        return c
+
+    def remove(self, client):
+        self._applied.pop(client, None)
+        return super().remove(client)
+
+    def configure(self, client, screen_rect):
+        def place(x, y, width, height, borderwidth, bordercolor, **kwargs):
+            self._place(client, x, y, width, height, borderwidth, bordercolor, **kwargs)
+
+        # the layouts call client.place() from deep inside configure(): shadow
+        # it on the instance for the duration of the call
+        client.place = place
+        try:
+            super().configure(client, screen_rect)
+        finally:
+            del client.place
+
+    def prelayout(self, windows, screen_rect):
+        """Configure the windows of a hidden group for ``screen_rect``, unmapped.
+
+        Once the group is shown on that rect, ``_place`` finds nothing left to do.
+        """
+
+        def keep(*args, **kwargs):
+            pass
+
+        for client in windows:
+            client.hide = client.unhide = keep
+        try:
+            self.layout(windows, screen_rect)
+        finally:
+            for client in windows:
+                del client.hide, client.unhide
+        self.diff_stats["prelayouts"] += 1
+
+    def _place(self, client, x, y, width, height, borderwidth, bordercolor, **kwargs):
+        above = kwargs.get("above", False)
+        respect_hints = kwargs.get("respect_hints", False)
+        top, right, bottom, left = _margins(kwargs.get("margin"))
+        geometry = (x + left, y + top, width - left - right, height - top - bottom)
+        current = (client.x, client.y, client.width, client.height)
+        applied = self._applied.get(client)
+
+        border = (borderwidth, bordercolor)
+        self._applied[client] = (geometry, border)
+
+        if above or respect_hints or applied is None or geometry != current:
+            self.diff_stats["places"] += 1
+            type(client).place(client, x, y, width, height, borderwidth, bordercolor, **kwargs)
+        elif border != (client.borderwidth, getattr(client, "bordercolor", None)):
+            self.diff_stats["borders"] += 1
+            client.paint_borders(bordercolor, borderwidth)
+        else:
+            self.diff_stats["skipped"] += 1
+
+    @expose_command()
+    def info(self):
+        d = super().info()
+        d["geometry_diff"] = dict(self.diff_stats)
+        return d
+
+
+class MonadTall(GeometryDiffMixin, layout.MonadTall):
+    """``layout.MonadTall`` that only configures the windows that change."""
+
+    def __init__(self, **config):
+        layout.MonadTall.__init__(self, **config)
+        self._reset_diff()
+
+
+class Columns(GeometryDiffMixin, layout.Columns):
+    """``layout.Columns`` that only configures the windows that change."""
+
+    def __init__(self, **config):
+        layout.Columns.__init__(self, **config)
+        self._reset_diff()
@@ -0,0 +1,294 @@
+"""Random wallpapers per screen, from a cache of pre-scaled images.
+
+Replaces ``feh --randomize --bg-fill ~/wallpapers/*`` in the autostart,
+which decoded and scaled a full-size image for every monitor on every login
+and never changed it again. ``Wallpapers``:
+
+- picks a random image per screen at startup and every ``interval`` seconds,
+  not when the config is reloaded;
+- scales each image once per output size, ``fill`` like feh (cover the
+  output, crop the overflow), and keeps the pixels raw in
+  ``~/.cache/qtile/wallpapers``. A cached image is memory-mapped straight
+  into a cairo surface, with no decoding;
+- decodes and scales in the default executor, off the event loop;
+- paints only the outputs that changed on ``screens_reconfigured`` (a
+  monitor plugged in, a resolution change). All of them are painted when the
+  root pixmap had to be recreated.
+
+Painting goes through qtile's own root pixmap painter, so the pixmap stays
+in ``_XROOTPMAP_ID`` for picom. Config::
+
+    wallpaper.start("~/wallpapers", interval=30 * 60)
+"""
+
+import hashlib
+import mmap
+import os
+import random
+import sys
+
+import cairocffi
+import cairocffi.pixbuf
+
+from libqtile import hook
+from libqtile.log_utils import logger
+from libqtile.utils import get_cache_dir
+
+from modules import memory
+
+CACHE = os.path.join(get_cache_dir(), "wallpapers")
+MAX_CACHED = 64
+EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif")
+FORMAT = cairocffi.FORMAT_RGB24
+
+
+def _cache_path(image, width, height):
+    stat = os.stat(image)
+    key = f"{image}\0{stat.st_mtime_ns}\0{stat.st_size}".encode()
+    return os.path.join(CACHE, f"{hashlib.sha1(key).hexdigest()}-{width}x{height}.rgb24")
+
+
+def render(image, width, height):
+    """In a thread: scale ``image`` to cover ``width`` x ``height``, write it to the cache."""
+    path = _cache_path(image, width, height)
+    if os.path.exists(path):
+        return path
+    with open(image, "rb") as f:
+        source, _ = cairocffi.pixbuf.decode_to_image_surface(f.read())
+    target = cairocffi.ImageSurface(FORMAT, width, height)
+    scale = max(width / source.get_width(), height / source.get_height())
+    with cairocffi.Context(target) as ctx:
+        ctx.translate(
+            (width - source.get_width() * scale) / 2, (height - source.get_height() * scale) / 2
+        )
+        ctx.scale(scale)
+        ctx.set_source_surface(source)
+        ctx.get_source().set_filter(cairocffi.FILTER_GOOD)
+        ctx.paint()
+    target.flush()
+    os.makedirs(CACHE, exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        f.write(target.get_data())
+    os.replace(path + ".tmp", path)
+    _prune()
+    return path
+
+
+def _prune():
+    try:
+        files = [os.path.join(CACHE, name) for name in os.listdir(CACHE)]
+    except OSError:
+        return
+    files.sort(key=lambda path: os.stat(path).st_atime, reverse=True)
+    for path in files[MAX_CACHED:]:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def _cached_files(module):
+    try:
+        return len(os.listdir(module.CACHE))
+    except OSError:
+        return 0
+
+
+memory.register(
+    "wallpaper.files",
+    sys.modules[__name__],
+    _cached_files,
+    limit="MAX_CACHED",
+    trim=lambda m: m._prune(),
+)
+
+
+def load(path, width, height):
+    """``(surface, mapping)``: a cairo surface on the memory-mapped cached pixels.
+
+    The mapping must outlive the surface.
+    """
+    with open(path, "rb") as f:
+        # copy on write: cairo wants a writable buffer, the file stays as is
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    stride = cairocffi.ImageSurface.format_stride_for_width(FORMAT, width)
+    return cairocffi.ImageSurface.create_for_data(data, FORMAT, width, height, stride), data
+
+
+def _geometry(screen):
+    return (screen.x, screen.y, screen.width, screen.height)
+
+
+class Wallpapers:
+    def __init__(self, directory, interval=None):
+        self.directory = os.path.expanduser(directory)
+        self.interval = interval
+        self.qtile = None
+        self.chosen = {}  # screen index -> image
+        self.painted = {}  # screen index -> (image, x, y, width, height)
+        self.timer = None
+        self.generation = 0
+        self.stats = dict(paints=0, renders=0, cache_hits=0)
+
+    def images(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            logger.exception("wallpaper: unable to list %s", self.directory)
+            return []
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in names
+            if name.lower().endswith(EXTENSIONS)
+        )
+
+    def start(self, qtile):
+        if qtile.core.name != "x11":
+            return
+        self.qtile = qtile
+        self.rotate()
+
+    def configure(self, directory, interval):
+        """Take a reloaded config's settings, keeping the wallpapers shown."""
+        self.directory = os.path.expanduser(directory)
+        if interval == self.interval:
+            return
+        self.interval = interval
+        if self.qtile is None:
+            return
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = self.qtile.call_later(interval, self.rotate) if interval else None
+
+    def rotate(self):
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = None
+        images = self.images()
+        if images:
+            screens = self.qtile.screens
+            # a different image per screen as long as there are enough
+            picks = random.sample(images, min(len(images), len(screens)))
+            self.chosen = {s.index: picks[s.index % len(picks)] for s in screens}
+            self.painted = {}
+            self.update()
+        if self.interval:
+            self.timer = self.qtile.call_later(self.interval, self.rotate)
+
+    def update(self):
+        """Paint the screens whose image or geometry is not the one painted."""
+        images = self.images()
+        wanted = {}
+        for screen in self.qtile.screens:
+            image = self.chosen.get(screen.index)
+            if image is None or not os.path.exists(image):
+                if not images:
+                    continue
+                image = self.chosen[screen.index] = random.choice(images)
+            target = (image, *_geometry(screen))
+            if self.painted.get(screen.index) != target:
+                wanted[screen.index] = target
+        if not wanted:
+            return
+        self.generation += 1
+        generation = self.generation
+        future = self.qtile.run_in_executor(self._render_all, wanted)
+        future.add_done_callback(lambda f: self._paint(f, generation))
+
+    def _render_all(self, wanted):
+        paths = {}
+        for index, (image, _, _, width, height) in wanted.items():
+            try:
+                cached = os.path.exists(_cache_path(image, width, height))
+                paths[index] = render(image, width, height)
+            except Exception:
+                logger.exception("wallpaper: unable to render %s", image)
+                continue
+            self.stats["cache_hits" if cached else "renders"] += 1
+        return paths, wanted
+
+    def _paint(self, future, generation):
+        if generation != self.generation:
+            # rotated or reconfigured meanwhile, a newer render is on its way
+            return
+        try:
+            paths, wanted = future.result()
+        except Exception:
+            logger.exception("wallpaper: rendering failed")
+            return
+        painter = self.qtile.core.painter
+        screens = {screen.index: screen for screen in self.qtile.screens}
+        size = (painter.width, painter.height)
+        # mirrors xcbq.Painter.paint, with a ready-made surface
+        root_pixmap, surface = painter._get_root_pixmap_and_surface(self.qtile.current_screen)
+        if size != (painter.width, painter.height):
+            # a new root pixmap: everything has to be painted again
+            wanted = dict(self.painted, **wanted)
+            paths.update(
+                (index, _cache_path(image, w, h))
+                for index, (image, _, _, w, h) in wanted.items()
+                if index not in paths
+            )
+        with cairocffi.Context(surface) as ctx:
+            for index, path in paths.items():
+                image, x, y, width, height = wanted[index]
+                screen = screens.get(index)
+                if screen is None or _geometry(screen) != (x, y, width, height):
+                    continue
+                try:
+                    source, data = load(path, width, height)
+                except (OSError, ValueError):
+                    logger.exception("wallpaper: unable to load %s", path)
+                    continue
+                ctx.set_source_surface(source, x, y)
+                ctx.rectangle(x, y, width, height)
+                ctx.fill()
+                source.finish()
+                data.close()
+                self.painted[index] = wanted[index]
+                self.stats["paints"] += 1
+        surface.finish()
+        painter._update_root_pixmap(root_pixmap)
+
+    def info(self):
+        return dict(self.stats, chosen=self.chosen, directory=self.directory)
+
+
+# a config reload runs this module again: keep the service, its timer and its images
+if "service" not in globals():
+    service = None
+_settings = None
+
+
+def start(directory, interval=None):
+    """Hook the service to qtile's startup and the screens.
+
+    The service is created at the first startup and kept across config
+    reloads, which only pass it the new ``directory`` and ``interval``.
+    """
+    global _settings
+    _settings = (directory, interval)
+    hook.subscribe.startup_once(_startup_once)
+    hook.subscribe.startup(_startup)
+    hook.subscribe.screens_reconfigured(_screens_reconfigured)
+
+
+def _startup_once():
+    global service
+    from libqtile import qtile
+
+    service = Wallpapers(*_settings)
+    service.start(qtile)
+
+
+def _startup():
+    if service is None:
+        # added to the config by a reload: nothing was picked yet
+        _startup_once()
+    else:
+        service.configure(*_settings)
+
+
+def _screens_reconfigured():
+    if service is not None and service.qtile is not None:
+        service.update()